@@ -0,0 +1,117 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from load_db import LoadDb
+
+
+class LengthBucketBatchSampler(object):
+    """
+    Batches of patient ids with similar recording length, to minimize padding.
+    Recordings are split into num_buckets length quantiles; batches are drawn within a bucket and the batch order is
+    shuffled. With num_replicas > 1 every rank gets a disjoint, equally sized share of the batches of an epoch.
+    It follows the torch batch_sampler protocol (__iter__ and __len__) without depending on torch.
+    """
+
+    def __init__(self, loader: LoadDb, batch_size: int, num_buckets: int = 10, cohort_query: str = None,
+                 shuffle: bool = True, drop_last: bool = False, num_replicas: int = 1, rank: int = 0,
+                 random_seed: int = 42):
+        """
+
+        :param loader: database to sample from
+        :param batch_size: number of patients per batch
+        :param num_buckets: number of length buckets. With num_buckets = 1 batching ignores recording length
+        :param cohort_query: query whose first column is the patient id. If None sample all the patients
+        :param shuffle: shuffle patients within buckets and the order of the batches
+        :param drop_last: drop the incomplete batch of each bucket
+        :param num_replicas: number of distributed processes
+        :param rank: rank of this process
+        :param random_seed: seed shared by all the ranks
+        """
+        cohort = f"WHERE patient_id IN ({cohort_query})" if cohort_query is not None else ''
+        rows = loader.read(f"SELECT patient_id, num_samples, duration FROM {loader.TABLE_PATIENTS} {cohort} "
+                           f"ORDER BY patient_id")
+        self.patient_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.lengths = np.array([r[1] if r[1] is not None else r[2] * loader.SAMPLING_FREQUENCY for r in rows],
+                                dtype=np.int64)
+
+        self.batch_size = batch_size
+        self.num_buckets = max(1, min(num_buckets, len(rows)))
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.random_seed = random_seed
+        self.epoch = 0
+
+        # equal count buckets over the length order
+        order = np.argsort(self.lengths, kind='stable')
+        self.buckets = np.array_split(order, self.num_buckets)
+
+    def set_epoch(self, epoch: int):
+        """ Reshuffle for a new epoch, with the same permutation on every rank. """
+        self.epoch = epoch
+
+    def _epoch_batches(self):
+        rng = np.random.default_rng((self.random_seed, self.epoch))
+        batches = []
+        for bucket in self.buckets:
+            bucket = rng.permutation(bucket) if self.shuffle else bucket
+            for start in range(0, len(bucket), self.batch_size):
+                batch = bucket[start:start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        # equal share per rank, wrapping around when the batches do not split evenly
+        if self.num_replicas > 1 and batches:
+            per_rank = -(-len(batches) // self.num_replicas)
+            batches = [batches[i % len(batches)] for i in range(self.rank, per_rank * self.num_replicas,
+                                                                 self.num_replicas)]
+        return batches
+
+    def __iter__(self):
+        for batch in self._epoch_batches():
+            yield self.patient_ids[batch].tolist()
+
+    def __len__(self):
+        return len(self._epoch_batches())
+
+    def padding_waste(self):
+        """
+        Fraction of padded samples when every batch of the current epoch is padded to its longest recording.
+        :return: padded samples / total samples
+        """
+        padded = total = 0
+        for batch in self._epoch_batches():
+            lengths = self.lengths[batch]
+            padded += lengths.max() * len(lengths) - lengths.sum()
+            total += lengths.max() * len(lengths)
+        return padded / total if total else 0.0
+
+
+def iter_padded_batches(loader: LoadDb, sampler: LengthBucketBatchSampler, leads: list = None):
+    """
+    Load the batches of a sampler from the database, padded to the longest recording of each batch.
+    :param loader: database to load from
+    :param sampler: batch sampler
+    :param leads: List of lead numbers to retrieve. If None retrieve all the leads
+    :return: generator of (patient ids, (batch, m, n) zero padded int16 numpy array, (batch,) lengths)
+    """
+    for patient_ids in sampler:
+        signals, lengths = loader.get_ecg_batch(patient_ids, leads)
+        yield patient_ids, signals, lengths
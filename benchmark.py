@@ -0,0 +1,115 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmarks.
+Usage: python benchmark.py codecs [data_dir db_file_name [n]]
+       python benchmark.py imports
+Without a database synthetic recordings are used, otherwise n recordings are sampled from the given database.
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ecg_codecs import codecs
+
+
+def benchmark_codecs(recordings: list, repeats: int = 3):
+    """
+    Report compression ratio and decode throughput of every available codec.
+    :param recordings: list of (num_leads, num_samples) int16 arrays
+    :param repeats: number of decode passes, the fastest one is reported
+    :return: list of (codec name, compression ratio, decode MB/s)
+    """
+    raw_bytes = sum(r.nbytes for r in recordings)
+    results = []
+    for codec in codecs.values():
+        if not codec.available:
+            print(f'{codec.name:<12} not available')
+            continue
+        blobs = [(codec.encode(r), r.shape) for r in recordings]
+        for (blob, shape), r in zip(blobs, recordings):
+            if not np.array_equal(codec.decode(blob, *shape), r):
+                raise AssertionError(f'codec {codec.name} does not round-trip')
+
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for blob, shape in blobs:
+                codec.decode(blob, *shape)
+            best = min(best, time.perf_counter() - start)
+
+        ratio = raw_bytes / sum(len(b) for b, _ in blobs)
+        throughput = raw_bytes / 1e6 / best
+        results.append((codec.name, ratio, throughput))
+        print(f'{codec.name:<12} ratio {ratio:6.2f}   decode {throughput:8.1f} MB/s')
+    return results
+
+
+def benchmark_imports(modules: tuple = ('load_db', 'create_db'), repeats: int = 3):
+    """
+    Report wall time and peak RSS of importing each module in a fresh interpreter, against a bare interpreter.
+    :param modules: module names, importable from the repository root
+    :param repeats: number of fresh interpreters per module, the fastest one is reported
+    :return: list of (module name, import seconds, peak RSS MB)
+    """
+    probe = 'import resource, time; t = time.perf_counter(); {}; ' \
+            'print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)'
+    results = []
+    for module in ('',) + tuple(modules):
+        runs = [subprocess.run([sys.executable, '-c', probe.format(f'import {module}' if module else 'pass')],
+                               capture_output=True, text=True, check=True, cwd=Path(__file__).parent)
+                for _ in range(repeats)]
+        seconds, rss = min(tuple(map(float, r.stdout.split())) for r in runs)
+        results.append((module or '<interpreter>', seconds, rss))
+        print(f'{module or "<interpreter>":<14} import {seconds * 1000:8.1f} ms   peak RSS {rss:7.1f} MB')
+    return results
+
+
+def synthetic_recordings(n: int = 20, num_samples: int = 2500, random_seed: int = 42):
+    """ ECG-like int16 recordings: periodic beats plus baseline wander and noise. """
+    rng = np.random.default_rng(random_seed)
+    t = np.arange(num_samples) / 250
+    recordings = []
+    for _ in range(n):
+        rate = rng.uniform(0.8, 1.6)
+        beats = np.exp(-((t * rate) % 1 - 0.5) ** 2 / 0.0005)
+        leads = rng.uniform(-1, 1, (12, 1)) * 1000 * beats + 100 * np.sin(2 * np.pi * 0.3 * t)
+        recordings.append((leads + rng.normal(0, 10, leads.shape)).astype(np.int16))
+    return recordings
+
+
+def load_recordings(data_dir: Path, db_file_name: str, n: int = 100):
+    from load_db import LoadDb
+
+    loader = LoadDb(data_dir=data_dir, db_file_name=db_file_name)
+    patient_ids = [p[0] for p in loader.get_patients_with_diagnoses(n=n)]
+    recordings = [np.ascontiguousarray(loader.get_ecg(patient_id=p).T, dtype=np.int16) for p in patient_ids]
+    loader.db.close()
+    return recordings
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'imports':
+        benchmark_imports()
+    elif len(sys.argv) > 3:
+        n = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+        benchmark_codecs(load_recordings(Path(sys.argv[2]), sys.argv[3], n))
+    else:
+        benchmark_codecs(synthetic_recordings())
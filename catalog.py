@@ -0,0 +1,130 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+PATIENT_DTYPE = np.dtype([('patient_id', np.int64), ('original_id', 'U32'), ('dataset_id', np.int32),
+                          ('age', np.float64), ('sex', np.float64), ('num_samples', np.int64),
+                          ('duration', np.float64), ('baselines', np.float64, (12,)),
+                          ('adc_gains', np.float64, (12,))])
+
+
+class PatientCatalog(object):
+    """
+    Read-only in-memory copy of the patients metadata, loaded with three queries.
+    patients is a structured array sorted by patient_id (NULL age/sex are NaN). Diagnoses are stored CSR style:
+    the diagnosis ids of patients[i] are dx_indices[dx_indptr[i]:dx_indptr[i + 1]].
+    """
+
+    def __init__(self, db_access):
+        """
+
+        :param db_access: LoadDb whose tables are cached
+        """
+        self.db_access = db_access
+        self.version = self._version()
+
+        columns = [f'bs{l}' for l in range(1, 13)] + [f'ad{l}' for l in range(1, 13)]
+        rows = db_access.read(f"SELECT patient_id, original_id, dataset_id, age, sex, num_samples, duration, "
+                              f"{', '.join(columns)} FROM {db_access.TABLE_PATIENTS} ORDER BY patient_id")
+        self.patients = np.zeros(len(rows), dtype=PATIENT_DTYPE)
+        if rows:
+            values = list(zip(*rows))
+            for i, name in enumerate(PATIENT_DTYPE.names[:7]):
+                column = values[i]
+                if PATIENT_DTYPE[name].kind == 'f':
+                    column = [np.nan if v is None else v for v in column]
+                self.patients[name] = column
+            self.patients['baselines'] = np.array(values[7:19], dtype=np.float64).T
+            self.patients['adc_gains'] = np.array(values[19:31], dtype=np.float64).T
+        # contiguous copy of the sort key, searchsorted on the strided field would copy it on every call
+        self.patient_ids = np.ascontiguousarray(self.patients['patient_id'])
+
+        diagnoses = np.array(db_access.read(f"SELECT patient_id, diagnosis_id FROM {db_access.TABLE_DIAGNOSES} "
+                                            f"ORDER BY patient_id"), dtype=np.int64).reshape(-1, 2)
+        rows_of = np.searchsorted(self.patient_ids, diagnoses[:, 0])
+        self.dx_indptr = np.concatenate([[0], np.cumsum(np.bincount(rows_of, minlength=len(self.patients)))])
+        self.dx_indices = diagnoses[:, 1]
+
+        dictionary = db_access.read(f"SELECT diagnosis_id, dx_code FROM {db_access.TABLE_DX_DICT}")
+        self.dx_codes = np.zeros(max([d[0] for d in dictionary], default=-1) + 1, dtype='U32')
+        for diagnosis_id, dx_code in dictionary:
+            self.dx_codes[diagnosis_id] = dx_code
+
+    def _version(self):
+        """ PRAGMA data_version of every attached database, and the changes made through this connection. """
+        schemas = [d[1] for d in self.db_access.read("PRAGMA database_list")]
+        versions = tuple(self.db_access.read(f"PRAGMA {s}.data_version")[0][0] for s in schemas)
+        return versions, self.db_access.db.total_changes
+
+    def is_stale(self):
+        return self._version() != self.version
+
+    def changed_here(self):
+        """ Whether the connection itself made changes since loading, a check that runs no query. """
+        return self.db_access.db.total_changes != self.version[1]
+
+    def rows(self, patient_ids, skip_missing: bool = False):
+        """
+        Catalog rows of some patients.
+        :param patient_ids: patient id or list of patient ids
+        :param skip_missing: drop the ids that are not in the catalog instead of raising KeyError
+        :return: row indices in patients, in the same order
+        """
+        patient_ids = np.atleast_1d(np.asarray(patient_ids, dtype=np.int64))
+        rows = np.minimum(np.searchsorted(self.patient_ids, patient_ids), max(len(self.patient_ids) - 1, 0))
+        found = self.patient_ids[rows] == patient_ids if len(self.patient_ids) else np.zeros(len(rows), dtype=bool)
+        if skip_missing:
+            return rows[found]
+        if not np.all(found):
+            raise KeyError(f'patient ids not found: {patient_ids[~found]}')
+        return rows
+
+    def diagnoses(self, row: int):
+        """ Diagnosis codes of the patient at a catalog row. """
+        return self.dx_codes[self.dx_indices[self.dx_indptr[row]:self.dx_indptr[row + 1]]].tolist()
+
+    def select(self, dataset_ids: list = None, sex: int = None, age_range: tuple = None, dx_codes: list = None,
+               min_duration: float = None):
+        """
+        Filter patients with vectorized conditions, all of them must hold.
+        :param dataset_ids: list of dataset ids
+        :param sex: 0 for female, 1 for male
+        :param age_range: (min age, max age), inclusive
+        :param dx_codes: list of diagnosis codes, patients with at least one of them are kept
+        :param min_duration: minimum recording duration in seconds
+        :return: numpy array of patient ids
+        """
+        mask = np.ones(len(self.patients), dtype=bool)
+        if dataset_ids is not None:
+            mask &= np.isin(self.patients['dataset_id'], dataset_ids)
+        if sex is not None:
+            mask &= self.patients['sex'] == sex
+        if age_range is not None:
+            mask &= (self.patients['age'] >= age_range[0]) & (self.patients['age'] <= age_range[1])
+        if dx_codes is not None:
+            hits = np.isin(self.dx_codes[self.dx_indices], dx_codes)
+            rows_of = np.repeat(np.arange(len(self.patients)), np.diff(self.dx_indptr))
+            mask &= np.bincount(rows_of, weights=hits, minlength=len(self.patients)) > 0
+        if min_duration is not None:
+            mask &= self.patients['duration'] >= min_duration
+        return self.patient_ids[mask]
+
+
+def sql_value(x):
+    """ Python value as SQLite returns it from an INT column: None for NULL, int when integral. """
+    if np.isnan(x):
+        return None
+    return int(x) if float(x).is_integer() else float(x)
@@ -0,0 +1,64 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.io import savemat
+
+import data_access.data_access
+from parameters import DefaultArguments
+
+
+@pytest.fixture
+def synthetic_dataset(tmp_path, monkeypatch):
+    """
+    Five 500 Hz recordings of DefaultArguments.CPSC2018 in two calibration groups; A3 has no diagnoses, A0 no age.
+    :return: (dataset name, dict of original id -> (12, n) int16 recording at 250 Hz)
+    """
+    dataset_name = DefaultArguments.CPSC2018
+    datasets, summaries = tmp_path / 'datasets', tmp_path / 'csv_summaries'
+    (datasets / dataset_name).mkdir(parents=True)
+    summaries.mkdir()
+    monkeypatch.setattr(data_access.data_access, 'datasets_path', datasets)
+    monkeypatch.setattr(data_access.data_access, 'csv_summaries', summaries)
+
+    rng = np.random.default_rng(0)
+    rows, recordings = [], {}
+    for i in range(5):
+        record_id, num_samples = f'A{i}', 2000 + 500 * i
+        baseline, adc_gain = (0.0, 1000.0) if i % 2 else (10.0, 500.0)
+        val = (rng.normal(40 * i, 100 + 20 * i, (12, num_samples))).astype(np.int16)
+        savemat(datasets / dataset_name / f'{record_id}.mat', {'val': val})
+        recordings[record_id] = val[:, ::2]
+        rows.append({'id': record_id, 'age': np.nan if i == 0 else 40 + i, 'sex': i % 2,
+                     'dx': str([] if i == 3 else DefaultArguments.all_labels[i:i + 2]), 'freq': 500,
+                     'num_samples': num_samples, 'leads': 12, 'duration': num_samples / 500,
+                     'baselines': str([str(baseline)] * 12), 'adcs': str([str(adc_gain)] * 12)})
+    pd.DataFrame(rows).to_csv(summaries / f'summary_{dataset_name}.csv')
+    return dataset_name, recordings
+
+
+@pytest.fixture
+def synthetic_db(tmp_path, synthetic_dataset):
+    """ :return: (data dir, database file name, dict of original id -> (12, n) int16 recording) """
+    from create_db import CreateDb
+
+    dataset_name, recordings = synthetic_dataset
+    builder = CreateDb(tmp_path, 'af.db')
+    builder.populate_schema(dataset_name=dataset_name, ds_portion=1)
+    builder.populate_data_tables(dataset_name=dataset_name, ds_portion=1)
+    builder.db.close()
+    return tmp_path, 'af.db', recordings
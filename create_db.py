@@ -13,14 +13,19 @@
 #  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 #  DEALINGS IN THE SOFTWARE.
 
-from db_access import DbAccess
+from db_access import DbAccess, shard_file_name, shard_id_offset
+from ecg_codecs import get_codec
+from qrs_detection import detect_r_peaks
+from running_stats import moments, merge_moments
 from pathlib import Path
 from parameters import DefaultArguments
 from data_access.data_access import DataBase
-from torch.utils.data import DataLoader
 from tqdm import tqdm
 
+import os
 import sys
+from multiprocessing import Pool
+
 import numpy as np
 
 datasets_path = Path('./data_access/datasets')
@@ -31,17 +36,36 @@ class CreateDb(DbAccess):
     TABLE_DX_DICT = 'diagnosis_dictionary'
     TABLE_DIAGNOSES = 'diagnoses'
     TABLE_DS_DICT = 'dataset_dictionary'
+    TABLE_ECG = 'ecg_signals'
+    TABLE_R_PEAKS = 'r_peaks'
+    TABLE_NORM_STATS = 'norm_stats'
+    SAMPLING_FREQUENCY = 250
+
+    def __init__(self, data_dir: Path, db_file_name: str, codec: str = 'delta_zlib', id_offset: int = 0,
+                 r_peak_lead: int = 2):
+        """
 
-    def __init__(self, data_dir: Path, db_file_name: str):
+        :param data_dir: Path to the .db file
+        :param db_file_name: database file name
+        :param codec: name of the lossless codec used to store ecg time series, see ecg_codecs.codecs
+        :param id_offset: patient ids start after this value, used to keep ids unique across dataset shards
+        :param r_peak_lead: lead number R peaks are detected on during ingest. If None skip R peak detection
+        """
         super(CreateDb, self).__init__(data_dir, db_file_name)
+        self.codec = get_codec(codec)
+        self.r_peak_lead = r_peak_lead
+        if not self.codec.available:
+            raise ImportError(f'ecg codec {self.codec.name} is not available in this environment')
         self.setup_schema()
+        self._set_id_offset(id_offset)
         self.dx_list = list(zip(range(len(DefaultArguments.all_labels)), DefaultArguments.all_labels))
         self.ds_list = list(zip(range(len(DefaultArguments.all_ds)), DefaultArguments.all_ds))
         self._populate_dictionaries()
 
     def setup_schema(self):
         """
-        Create all tables except for time series ones.
+        Create all tables: dictionaries, patients and diagnoses, encoded ecg time series, R peaks and normalization
+        statistics.
         :return:
         """
         self.write(f'CREATE TABLE IF NOT EXISTS {self.TABLE_DS_DICT} ('
@@ -79,19 +103,66 @@ class CreateDb(DbAccess):
                    f'FOREIGN KEY (dataset_id) '
                    f'REFERENCES {self.TABLE_DS_DICT} (ds_id));')
 
-    def _setup_data_table(self, original_id: str):
+        self.write(f'CREATE TABLE IF NOT EXISTS {self.TABLE_ECG} ('
+                   f'patient_id INTEGER PRIMARY KEY,'
+                   f'codec_id INT NOT NULL,'
+                   f'num_leads INT,'
+                   f'num_samples INT,'
+                   f'data BLOB,'
+                   f'CONSTRAINT patient_id '
+                   f'FOREIGN KEY (patient_id) '
+                   f'REFERENCES {self.TABLE_PATIENTS} (patient_id));')
+
+        # R peak sample positions as little endian uint32 array
+        self.write(f'CREATE TABLE IF NOT EXISTS {self.TABLE_R_PEAKS} ('
+                   f'patient_id INTEGER PRIMARY KEY,'
+                   f'lead INT,'
+                   f'num_beats INT,'
+                   f'positions BLOB,'
+                   f'CONSTRAINT patient_id '
+                   f'FOREIGN KEY (patient_id) '
+                   f'REFERENCES {self.TABLE_PATIENTS} (patient_id));')
+
+        # per lead moments in ADC units, partitioned by dataset and calibration (baseline, ADC gain)
+        self.write(f'CREATE TABLE IF NOT EXISTS {self.TABLE_NORM_STATS} ('
+                   f'dataset_id INT NOT NULL,'
+                   f'lead INT NOT NULL,'
+                   f'baseline REAL NOT NULL,'
+                   f'adc_gain REAL NOT NULL,'
+                   f'count INT,'
+                   f'mean REAL,'
+                   f'm2 REAL,'
+                   f'PRIMARY KEY (dataset_id, lead, baseline, adc_gain),'
+                   f'CONSTRAINT dataset_id '
+                   f'FOREIGN KEY (dataset_id) '
+                   f'REFERENCES {self.TABLE_DS_DICT} (ds_id));')
+
+    def _store_norm_stats(self, ds_id: int, stats: dict):
         """
-        Create time series table for patient with patient_id.
-        :param original_id: Patient id formatted using original file names where time series were stored in.
+        Store per lead moments accumulated during ingest in the norm_stats table, replacing the statistics of a
+        previous ingest of the same dataset: merging them would count every sample twice.
+        :param ds_id: dataset id
+        :param stats: dict of (lead, baseline, adc gain) -> (count, mean, m2) in ADC units, over the whole dataset
         :return:
         """
+        values = [(ds_id, lead, baseline, adc_gain) + tuple(float(v) for v in lead_stats)
+                  for (lead, baseline, adc_gain), lead_stats in stats.items()]
+        self.write(f"DELETE FROM {self.TABLE_NORM_STATS} WHERE dataset_id = {ds_id}")
+        self.write_many(f"INSERT INTO {self.TABLE_NORM_STATS} "
+                        f"(dataset_id, lead, baseline, adc_gain, count, mean, m2) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        values)
 
-        ecg_leads_table = 'data_' + str(original_id)
-
-        self.write(f'CREATE TABLE IF NOT EXISTS {ecg_leads_table} ('
-                   f'time_id INTEGER PRIMARY KEY, '
-                   f'lead1 INTEGER, lead2 INTEGER, lead3 INTEGER, lead4 INTEGER, lead5 INTEGER, lead6 INTEGER, '
-                   f'lead7 INTEGER, lead8 INTEGER, lead9 INTEGER, lead10 INTEGER, lead11 INTEGER, lead12 INTEGER)')
+    def _set_id_offset(self, id_offset: int):
+        """
+        Make AUTOINCREMENT patient ids start after id_offset. Only applies to an empty patients table.
+        :param id_offset: last patient id reserved to other shards
+        :return:
+        """
+        if not id_offset:
+            return
+        seq = self.read(f"SELECT seq FROM sqlite_sequence WHERE name = '{self.TABLE_PATIENTS}'")
+        if not seq:
+            self.write(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('{self.TABLE_PATIENTS}', {id_offset})")
 
     def _populate_dictionaries(self):
         """
@@ -121,16 +192,12 @@ class CreateDb(DbAccess):
 
         ds = DataBase(dataset_name=dataset_name, selected_leads=DefaultArguments.twelve_leads,
                       ds_portion=ds_portion)
-        dl = DataLoader(ds, shuffle=False)
         ds_id = ds_dict[dataset_name]
 
         print('Populating patients tables...')
-        for pid, _, labels, age, sex, baselines, adcs, num_samples, num_leads, duration in tqdm(dl):
-            bs = [b.item() for b in baselines]
-            ad = [a.item() for a in adcs]
-
-            age = 'NULL' if np.isnan(age) else age.item()
-            sex = 'NULL' if np.isnan(sex) else sex.item()
+        for pid, _, labels, age, sex, bs, ad, num_samples, num_leads, duration in tqdm(ds):
+            age = 'NULL' if np.isnan(age) else age
+            sex = 'NULL' if np.isnan(sex) else sex
 
             # populate patients table
             self.write(f"INSERT INTO {self.TABLE_PATIENTS} "
@@ -138,26 +205,24 @@ class CreateDb(DbAccess):
                        f"bs1, bs2, bs3, bs4, bs5, bs6, bs7, bs8, bs9, bs10, bs11, bs12, "
                        f"ad1, ad2, ad3, ad4, ad5, ad6, ad7, ad8, ad9, ad10, ad11, ad12) "
                        f"VALUES "
-                       f"('{pid[0]}', {ds_id}, {age}, {sex}, "
-                       f"{num_leads.item()}, {num_samples.item()}, {duration.item()}, "
+                       f"('{pid}', {ds_id}, {age}, {sex}, "
+                       f"{num_leads}, {num_samples}, {duration}, "
                        f"{bs[0]}, {bs[1]}, {bs[2]}, {bs[3]}, {bs[4]}, {bs[5]}, {bs[6]}, {bs[7]}, {bs[8]}, {bs[9]}, {bs[10]}, {bs[11]}, "
                        f"{ad[0]}, {ad[1]}, {ad[2]}, {ad[3]}, {ad[4]}, {ad[5]}, {ad[6]}, {ad[7]}, {ad[8]}, {ad[9]}, {ad[10]}, {ad[11]})")
 
             # populate diagnoses table
-            labels_id = [dx_dict[l[0]] for l in labels]
+            labels_id = [dx_dict[l] for l in labels]
             patient_id = self.read(f"SELECT MAX(patient_id) FROM {self.TABLE_PATIENTS}")
             diagnoses_values = [(patient_id[0][0], l) for l in labels_id]
 
             self.write_many(f"INSERT INTO {self.TABLE_DIAGNOSES} (patient_id, diagnosis_id)"
                             f"VALUES (?, ?)", diagnoses_values)
-
-            # setup data tables
-            self._setup_data_table(pid[0])
         print(f'INFO: {dataset_name} schema tables population completed.', file=sys.stdout)
 
     def populate_data_tables(self, dataset_name: str, ds_portion: int):
         """
-        Populate ecg time series tables.
+        Populate ecg time series table, one blob per recording encoded with the selected codec, the R peaks
+        table and the normalization statistics.
         :param dataset_name: Dataset name
         :param ds_portion: Portion of original dataset to sample. If ds_portion = 1 include the whole dataset
         :return:
@@ -165,14 +230,73 @@ class CreateDb(DbAccess):
 
         ds = DataBase(dataset_name=dataset_name, selected_leads=DefaultArguments.twelve_leads,
                       ds_portion=ds_portion)
-        dl = DataLoader(ds, shuffle=False)
+        ds_id = dict([(d[1], d[0]) for d in self.ds_list])[dataset_name]
+        patient_ids = dict(self.read(f"SELECT original_id, patient_id FROM {self.TABLE_PATIENTS} "
+                                     f"WHERE dataset_id = {ds_id}"))
+
+        stats = {}
 
         print('Populating data tables...')
-        for pid, ecg, _, _, _, _, _, _, _, _ in tqdm(dl):
-            ecg = ecg.squeeze().permute(1, 0).numpy()
-            ecg = [tuple(ecg[t, :]) for t in range(ecg.shape[0])]
+        for pid, ecg, _, _, _, bs, ad, _, _, _ in tqdm(ds):
+            num_leads, num_samples = ecg.shape
+
+            count, mean, m2 = moments(ecg, axis=1)
+            for lead in range(num_leads):
+                key = (lead + 1, bs[lead], ad[lead])
+                lead_stats = (count, mean[lead], m2[lead])
+                stats[key] = merge_moments(stats[key], lead_stats) if key in stats else lead_stats
 
-            self.write_many(f"INSERT INTO data_{pid[0]} (lead1, lead2, lead3, lead4, lead5, lead6, " \
-                            f"lead7, lead8, lead9, lead10, lead11, lead12) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", ecg)
+            self.write_many(f"INSERT INTO {self.TABLE_ECG} (patient_id, codec_id, num_leads, num_samples, data) "
+                            f"VALUES (?, ?, ?, ?, ?)",
+                            [(patient_ids[pid], self.codec.codec_id, num_leads, num_samples,
+                              self.codec.encode(ecg))])
 
+            if self.r_peak_lead is not None:
+                peaks = detect_r_peaks(ecg[self.r_peak_lead - 1], self.SAMPLING_FREQUENCY)
+                self.write_many(f"INSERT INTO {self.TABLE_R_PEAKS} (patient_id, lead, num_beats, positions) "
+                                f"VALUES (?, ?, ?, ?)",
+                                [(patient_ids[pid], self.r_peak_lead, len(peaks), peaks.astype('<u4').tobytes())])
+
+        self._store_norm_stats(ds_id, stats)
         print(f'INFO: {dataset_name} data population completed.', file=sys.stdout)
+
+
+def _create_shard(args):
+    data_dir, db_file_name, dataset_name, ds_portion, codec, r_peak_lead = args
+    shard = shard_file_name(db_file_name, dataset_name)
+    # build into a fresh file and replace the shard at the end: rebuilding never appends to the old data, and an
+    # interrupted build leaves the previous shard untouched
+    partial = Path(data_dir) / f'{shard}.partial'
+    if partial.exists():
+        partial.unlink()
+    builder = CreateDb(data_dir, partial.name, codec=codec, id_offset=shard_id_offset(dataset_name),
+                       r_peak_lead=r_peak_lead)
+    builder.populate_schema(dataset_name=dataset_name, ds_portion=ds_portion)
+    builder.populate_data_tables(dataset_name=dataset_name, ds_portion=ds_portion)
+    builder.db.close()
+    os.replace(partial, Path(data_dir) / shard)
+    return shard
+
+
+def create_shards(data_dir: Path, db_file_name: str, datasets: list = None, ds_portion: int = 1,
+                  codec: str = 'delta_zlib', processes: int = None, r_peak_lead: int = 2):
+    """
+    Create one database file per dataset, in parallel processes. Open the shard set with LoadDb(data_dir, shards).
+    Existing shards of the datasets are replaced.
+    :param data_dir: Path to the .db files
+    :param db_file_name: database file name of the whole shard set, shards are named with shard_file_name
+    :param datasets: Dataset names, if None all the datasets in DefaultArguments.all_ds
+    :param ds_portion: Portion of original dataset to sample. If ds_portion = 1 include the whole dataset
+    :param codec: name of the lossless codec used to store ecg time series
+    :param processes: number of worker processes, if None one per dataset
+    :param r_peak_lead: lead number R peaks are detected on during ingest. If None skip R peak detection
+    :return: list of shard file names
+    """
+    datasets = DefaultArguments.all_ds if datasets is None else datasets
+    jobs = [(data_dir, db_file_name, ds, ds_portion, codec, r_peak_lead) for ds in datasets]
+    if not jobs:
+        return []
+    with Pool(processes=processes or len(jobs)) as pool:
+        shards = pool.map(_create_shard, jobs)
+    print(f'INFO: {len(shards)} shards created.', file=sys.stdout)
+    return shards
@@ -17,18 +17,22 @@ import sys
 from ast import literal_eval
 from pathlib import Path
 
-import pandas as pd
-import torch
-from torch.utils.data import Dataset
-
 from .prepare import get_recording
+from .sources import open_source, TarSource
 
 datasets_path = Path('./datasets')
 csv_summaries = Path('/csv_summaries')
 
 
-class DataBase(Dataset):
+class DataBase(object):
+    """
+    Records of one dataset as plain python/numpy values. It implements the map-style dataset protocol, so it can
+    still be wrapped in a torch DataLoader, but iterating over it directly does not require torch.
+    """
+
     def __init__(self, dataset_name, selected_leads, ds_portion=1.0, random_seed=42):
+        import pandas as pd
+
         try:
             self.df = pd.read_csv(csv_summaries / f'summary_{dataset_name}.csv')
         except:
@@ -36,7 +40,7 @@ class DataBase(Dataset):
             sys.exit(1)
 
         self.dataset_name = dataset_name
-        self.dataset = datasets_path / dataset_name
+        self.source = open_source(dataset_name, datasets_path)
         self.leads = selected_leads
 
         # random sample dataset, for testing purposes
@@ -44,18 +48,26 @@ class DataBase(Dataset):
             self.df = self.df.sample(frac=ds_portion, random_state=random_seed)
         elif ds_portion > 1:
             self.df = self.df.sample(n=ds_portion, random_state=random_seed)
+        if isinstance(self.source, TarSource):
+            # a backward seek in a gzip stream decompresses from the start of the archive: read in archive order
+            offsets = self.df['id'].map(lambda x: self.source.index[str(x)]['.mat'][0])
+            self.df = self.df.iloc[offsets.to_numpy().argsort(kind='stable')]
         self.df.reset_index(inplace=True)
 
     def __len__(self):
         return len(self.df)
 
+    def __iter__(self):
+        for item in range(len(self)):
+            yield self[item]
+
     def __getitem__(self, item):
 
         # patient_id
         patient_id = self.df['id'][item]
 
         # ecg leads loading
-        ecg_leads = get_recording(file=self.dataset / str(self.df['id'][item] + '.mat'),
+        ecg_leads = get_recording(file=self.source.recording(str(self.df['id'][item])),
                                   selected_leads=self.leads)
 
         # target
@@ -76,10 +88,10 @@ class DataBase(Dataset):
 
         # covariates
         age = self.df['age'][item]
-        sex = torch.tensor(self.df['sex'][item])
+        sex = self.df['sex'][item]
 
-        # Note: for model training tasks consider to add to this pipeline time series padding,
-        # normalization, one-hot encoding.
+        # Note: for model training tasks consider to add to this pipeline time series padding and one-hot encoding.
+        # Normalization statistics are accumulated by CreateDb, see LoadDb.get_ecg(normalize=True).
 
         return patient_id, ecg_leads, labels, age, sex, baselines, adcs, num_samples, num_leads, duration
 
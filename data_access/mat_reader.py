@@ -0,0 +1,148 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Reader for the challenge .mat files: a single uncompressed int16 matrix named 'val', in MAT v4 or v5 format.
+Only the header is parsed, the samples are read with a single np.fromfile/np.frombuffer call.
+read_val returns None for any other layout, in which case scipy.io.loadmat has to be used.
+"""
+
+import struct
+
+import numpy as np
+
+HEADER_BYTES = 512
+
+# MAT v5 data types and classes
+MI_INT16 = 3
+MI_INT32 = 5
+MI_UINT32 = 6
+MI_INT8 = 1
+MI_MATRIX = 14
+MX_INT16_CLASS = 10
+COMPLEX_FLAG = 0x08
+
+
+def read_val(file):
+    """
+    Read the 'val' matrix of a challenge .mat file.
+    :param file: path or file-like object
+    :return: (num_leads, num_samples) int16 numpy array, None if the file layout is not supported
+    """
+    if hasattr(file, 'read'):
+        buffer = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+        layout = _parse_header(buffer[:HEADER_BYTES])
+        if layout is None:
+            return None
+        dtype, offset, rows, cols = layout
+        if offset + rows * cols * 2 > len(buffer):
+            return None
+        # copy, as np.fromfile does: a view of the bytes would be read-only
+        data = np.frombuffer(buffer, dtype=dtype, count=rows * cols, offset=offset).copy()
+    else:
+        with open(file, 'rb') as f:
+            layout = _parse_header(f.read(HEADER_BYTES))
+            if layout is None:
+                return None
+            dtype, offset, rows, cols = layout
+            f.seek(offset)
+            data = np.fromfile(f, dtype=dtype, count=rows * cols)
+        if len(data) != rows * cols:
+            return None
+
+    # column-major on disk: (cols, rows) in C order is the transposed matrix
+    return data.reshape(cols, rows).T
+
+
+def _parse_header(header: bytes):
+    """ :return: (dtype, data offset, rows, cols) or None """
+    if len(header) >= 128 and header[126:128] in (b'IM', b'MI'):
+        return _parse_v5(header)
+    return _parse_v4(header)
+
+
+def _parse_v4(header: bytes):
+    if len(header) < 20:
+        return None
+    for endian in ('<', '>'):
+        mopt, rows, cols, imagf, name_length = struct.unpack_from(f'{endian}5i', header)
+        if 0 <= mopt < 5000:
+            break
+    else:
+        return None
+    machine, zero, precision, matrix_type = mopt // 1000, mopt // 100 % 10, mopt // 10 % 10, mopt % 10
+    # little (0) or big (1) endian IEEE, int16 (3) full (0) real matrix
+    if machine != (0 if endian == '<' else 1) or zero != 0 or precision != 3 or matrix_type != 0 or imagf != 0:
+        return None
+    if header[20:20 + name_length] != b'val\x00':
+        return None
+    return np.dtype(f'{endian}i2'), 20 + name_length, rows, cols
+
+
+def _parse_v5(header: bytes):
+    endian = '<' if header[126:128] == b'IM' else '>'
+    offset = 128
+
+    data_type, size = struct.unpack_from(f'{endian}2I', header, offset)
+    if data_type != MI_MATRIX:
+        return None  # compressed (miCOMPRESSED) or unexpected first element
+    offset += 8
+
+    # array flags
+    data_type, size = struct.unpack_from(f'{endian}2I', header, offset)
+    if data_type != MI_UINT32 or size != 8:
+        return None
+    flags, = struct.unpack_from(f'{endian}I', header, offset + 8)
+    if flags & 0xff != MX_INT16_CLASS or flags & (COMPLEX_FLAG << 8):
+        return None
+    offset += 16
+
+    # dimensions
+    data_type, size = struct.unpack_from(f'{endian}2I', header, offset)
+    if data_type != MI_INT32 or size != 8:
+        return None
+    rows, cols = struct.unpack_from(f'{endian}2i', header, offset + 8)
+    offset += 16
+
+    # array name, possibly in small data element format
+    name, offset = _read_element(header, offset, endian)
+    if name is None or name[0] != MI_INT8 or name[1] != b'val':
+        return None
+
+    # real part
+    data_type, size, small = _element_tag(header, offset, endian)
+    if data_type != MI_INT16 or small or size != rows * cols * 2:
+        return None
+    return np.dtype(f'{endian}i2'), offset + 8, rows, cols
+
+
+def _element_tag(header: bytes, offset: int, endian: str):
+    """ :return: (data type, size in bytes, small data element format) """
+    first, = struct.unpack_from(f'{endian}I', header, offset)
+    if first >> 16:
+        return first & 0xffff, first >> 16, True
+    data_type, size = struct.unpack_from(f'{endian}2I', header, offset)
+    return data_type, size, False
+
+
+def _read_element(header: bytes, offset: int, endian: str):
+    """ :return: ((data type, data bytes), offset of the next element) """
+    data_type, size, small = _element_tag(header, offset, endian)
+    if small:
+        return (data_type, header[offset + 4:offset + 4 + size]), offset + 8
+    padded = (size + 7) // 8 * 8
+    if offset + 8 + padded > len(header):
+        return None, offset
+    return (data_type, header[offset + 8:offset + 8 + size]), offset + 8 + padded
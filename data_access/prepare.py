@@ -15,11 +15,11 @@
 
 from pathlib import Path
 
-import pandas as pd
-from scipy.io import loadmat
 from tqdm import tqdm
 
 from .helper_code import *
+from .mat_reader import read_val
+from .sources import open_source
 
 from parameters import DefaultArguments
 
@@ -33,12 +33,23 @@ same_diag_dict = {'164909002': '733534002',
 
 
 def get_recording(file, selected_leads):
-    """ Get ecg time series from mat files"""
+    """ Get ecg time series from mat files, given as a path or a file-like object (see sources)"""
+    mat_recording = read_val(file)
+    if mat_recording is None:
+        # unexpected layout, e.g. compressed or non int16
+        from scipy.io import loadmat
+
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        mat_recording = loadmat(file)['val']
+
+    available_leads = DefaultArguments.twelve_leads  # all recording files have 12 leads
+    if tuple(selected_leads) == available_leads and mat_recording.shape[0] == len(available_leads):
+        return mat_recording
+
     num_leads = len(selected_leads)
-    mat_recording = loadmat(file)['val']
     num_samples = np.shape(mat_recording)[1]
     chosen_recording = np.zeros((num_leads, num_samples), mat_recording.dtype)
-    available_leads = DefaultArguments.twelve_leads  # all recording files have 12 leads
     for i, lead in enumerate(selected_leads):
         if lead in available_leads:
             j = available_leads.index(lead)
@@ -47,7 +58,10 @@ def get_recording(file, selected_leads):
 
 
 def prepare_summary_csv():
-    """ Prepare csv summary with all data for each entry except for the ecg time series"""
+    """ Prepare csv summary with all data for each entry except for the ecg time series. Datasets are read from their
+    extracted directory or directly from their archive, see sources.open_source """
+    import pandas as pd
+
     csv_summaries.mkdir(exist_ok=True)
     print('Preparation of headers summaries per dataset...')
     unscored_df = pd.read_csv('./data_access/unscored.csv')
@@ -60,27 +74,26 @@ def prepare_summary_csv():
     unscored_df['SNOMEDCTCode'] = unscored_df['SNOMEDCTCode'].astype(int)
 
     for ds in DefaultArguments.all_ds:
-        ds_path = str(datasets_path / ds)
+        source = open_source(ds, datasets_path)
         unscored = 0
-        for subdir, dirs, files in os.walk(ds_path):
-            files = list(filter(lambda x: x.endswith('.hea'), files))
-            id, age, sex, dx, rx, sx, hx, freq, num_samples, leads, duration, baselines, adcs = ([] for _ in range(13))
-            for file in tqdm(files):
-                header = load_header(os.path.join(subdir, file))
-                labels = preprocess_labels(get_covariates(header, '#Dx'), unscored_df)
-                if not labels:
-                    unscored += 1
-                    continue
-                id.append(get_recording_id(header))
-                age.append(get_age(header))
-                sex.append(get_encoded_sex(header))
-                dx.append(labels)
-                baselines.append(list(map(str, get_baselines(header, DefaultArguments.twelve_leads))))
-                adcs.append(list(map(str, get_adc_gains(header, DefaultArguments.twelve_leads))))
-                freq.append(get_frequency(header))
-                num_samples.append(get_num_samples(header))
-                leads.append(len(get_leads(header)))
-                duration.append(get_num_samples(header) / get_frequency(header))
+        total = 0
+        id, age, sex, dx, rx, sx, hx, freq, num_samples, leads, duration, baselines, adcs = ([] for _ in range(13))
+        for header in tqdm(source.headers()):
+            total += 1
+            labels = preprocess_labels(get_covariates(header, '#Dx'), unscored_df)
+            if not labels:
+                unscored += 1
+                continue
+            id.append(get_recording_id(header))
+            age.append(get_age(header))
+            sex.append(get_encoded_sex(header))
+            dx.append(labels)
+            baselines.append(list(map(str, get_baselines(header, DefaultArguments.twelve_leads))))
+            adcs.append(list(map(str, get_adc_gains(header, DefaultArguments.twelve_leads))))
+            freq.append(get_frequency(header))
+            num_samples.append(get_num_samples(header))
+            leads.append(len(get_leads(header)))
+            duration.append(get_num_samples(header) / get_frequency(header))
 
         d = {'id': id, 'age': age, 'sex': sex, 'dx': dx, 'freq': freq,
              'num_samples': num_samples, 'leads': leads, 'duration': duration,
@@ -88,7 +101,7 @@ def prepare_summary_csv():
 
         # unscored stats
         with open(csv_summaries / str(f'unscored_summary.txt'), 'a') as f:
-            f.write(f'{ds} - Out of {str(len(files))} entries {unscored} had only unscored labels and were removed. \n')
+            f.write(f'{ds} - Out of {str(total)} entries {unscored} had only unscored labels and were removed. \n')
         f.close()
         df = pd.DataFrame.from_dict(d)
         df.to_csv(csv_summaries / str(f'summary_{ds}.csv'))
@@ -0,0 +1,157 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Sources of .hea/.mat records: an extracted dataset directory, or the tar(.gz)/zip archive PhysioNet distributes,
+read in place. Archive members are indexed by record id once; for tar archives the index (uncompressed data offset
+and size of every member) is saved next to the archive as <archive>.index.json, together with the archive size and
+modification time: an index that does not match the archive is rebuilt.
+Records are best read in archive order (DataBase does): forward seeks in a gzip stream only decompress the gap.
+"""
+
+import gzip
+import io
+import json
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar', '.zip')
+
+
+def open_source(dataset_name: str, root: Path = Path('./datasets')):
+    """
+    Open the records of a dataset, preferring the extracted directory over an archive.
+    :param dataset_name: Dataset name
+    :param root: directory holding dataset directories or archives, e.g. WFDB_PTBXL/ or WFDB_PTBXL.tar.gz
+    :return: DirectorySource, TarSource or ZipSource
+    """
+    if (root / dataset_name).is_dir():
+        return DirectorySource(root / dataset_name)
+    for suffix in ARCHIVE_SUFFIXES:
+        archive = root / f'{dataset_name}{suffix}'
+        if archive.is_file():
+            return ZipSource(archive) if suffix == '.zip' else TarSource(archive)
+    raise FileNotFoundError(f'no directory or archive for {dataset_name} in {root}')
+
+
+def _split_member(member_name: str):
+    return os.path.splitext(os.path.basename(member_name))
+
+
+class DirectorySource(object):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def headers(self):
+        """ Generator of header file contents, as strings. """
+        for subdir, _, files in os.walk(self.path):
+            for file in sorted(filter(lambda x: x.endswith('.hea') and not x.startswith('.'), files)):
+                with open(os.path.join(subdir, file), 'r') as f:
+                    yield f.read()
+
+    def recording(self, record_id: str):
+        """ Path of the .mat file of a record. """
+        return self.path / f'{record_id}.mat'
+
+
+class TarSource(object):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_file = self.path.with_name(self.path.name + '.index.json')
+        self._index = None
+        self._stream = None
+
+    @property
+    def index(self):
+        """ dict of record id -> {extension: (uncompressed data offset, size)}, built with one pass if missing. """
+        if self._index is None:
+            self._index = self._load_index()
+        if self._index is None:
+            for _ in self.headers():
+                pass
+        return self._index
+
+    def headers(self):
+        """ Generator of header file contents, streaming the archive sequentially. Builds the member index. """
+        index = {}
+        with tarfile.open(self.path, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                record_id, extension = _split_member(member.name)
+                if record_id.startswith('.'):
+                    continue
+                index.setdefault(record_id, {})[extension] = (member.offset_data, member.size)
+                if extension == '.hea':
+                    yield tar.extractfile(member).read().decode()
+        self._index = index
+        self._save_index()
+
+    def recording(self, record_id: str):
+        """ Contents of the .mat file of a record, as an in-memory file. """
+        offset, size = self.index[record_id]['.mat']
+        if self._stream is None:
+            self._stream = gzip.open(self.path, 'rb') if self._is_gzip() else open(self.path, 'rb')
+        self._stream.seek(offset)
+        return io.BytesIO(self._stream.read(size))
+
+    def _is_gzip(self):
+        with open(self.path, 'rb') as f:
+            return f.read(2) == b'\x1f\x8b'
+
+    def _archive_stamp(self):
+        stat = self.path.stat()
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_index(self):
+        """ :return: saved index, None if missing or built from another version of the archive """
+        try:
+            with open(self.index_file, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(saved, dict) or saved.get('archive') != self._archive_stamp():
+            return None
+        return saved.get('members')
+
+    def _save_index(self):
+        try:
+            with open(self.index_file, 'w') as f:
+                json.dump({'archive': self._archive_stamp(), 'members': self._index}, f)
+        except OSError:
+            pass  # read-only location: the index is rebuilt next time
+
+
+class ZipSource(object):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.zip = zipfile.ZipFile(self.path)
+        self.index = {}
+        for info in self.zip.infolist():
+            record_id, extension = _split_member(info.filename)
+            if not info.is_dir() and not record_id.startswith('.'):
+                self.index.setdefault(record_id, {})[extension] = info.filename
+
+    def headers(self):
+        """ Generator of header file contents, in archive order. """
+        for info in self.zip.infolist():
+            if info.filename.endswith('.hea') and not _split_member(info.filename)[0].startswith('.'):
+                yield self.zip.read(info).decode()
+
+    def recording(self, record_id: str):
+        """ Contents of the .mat file of a record, as an in-memory file. """
+        return io.BytesIO(self.zip.read(self.index[record_id]['.mat']))
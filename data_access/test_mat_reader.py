@@ -0,0 +1,79 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import io
+
+import numpy as np
+import pytest
+from scipy.io import savemat
+
+from data_access.mat_reader import read_val
+from data_access.prepare import get_recording
+from parameters import DefaultArguments
+
+
+@pytest.fixture
+def val():
+    rng = np.random.default_rng(0)
+    val = rng.integers(-2000, 2000, (12, 1000)).astype(np.int16)
+    val[0, :2] = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+    return val
+
+
+def _mat(tmp_path, data, **kwargs):
+    file = tmp_path / 'record.mat'
+    savemat(file, data, **kwargs)
+    return file
+
+
+@pytest.mark.parametrize('kwargs', [{'format': '4'}, {'format': '5'}], ids=['v4', 'v5'])
+def test_read_val(tmp_path, val, kwargs):
+    file = _mat(tmp_path, {'val': val}, **kwargs)
+    for source in (file, io.BytesIO(file.read_bytes())):
+        data = read_val(source)
+        assert data.dtype == np.int16
+        assert np.array_equal(data, val)
+        data[0, 0] = 0  # writable for paths and file-like objects
+
+
+@pytest.mark.parametrize('data, kwargs', [
+    (lambda val: {'val': val}, {'do_compression': True}),
+    (lambda val: {'val': val.astype(np.int32)}, {}),
+    (lambda val: {'val': val.astype(np.float64)}, {'format': '4'}),
+], ids=['compressed', 'int32', 'double_v4'])
+def test_unsupported_layout_falls_back_to_scipy(tmp_path, val, data, kwargs):
+    file = _mat(tmp_path, data(val), **kwargs)
+    assert read_val(file) is None
+    assert np.array_equal(get_recording(file, DefaultArguments.twelve_leads), val)
+    assert np.array_equal(get_recording(io.BytesIO(file.read_bytes()), DefaultArguments.twelve_leads), val)
+
+
+@pytest.mark.parametrize('kwargs', [{'format': '4'}, {'format': '5'}], ids=['v4', 'v5'])
+def test_other_variable_name(tmp_path, val, kwargs):
+    assert read_val(_mat(tmp_path, {'ecg': val}, **kwargs)) is None
+
+
+def test_truncated_file(tmp_path, val):
+    file = _mat(tmp_path, {'val': val})
+    assert read_val(io.BytesIO(file.read_bytes()[:-10])) is None
+
+
+def test_get_recording_lead_subset(tmp_path, val):
+    file = _mat(tmp_path, {'val': val})
+    leads = ('V1', 'II', 'unknown')
+    data = get_recording(file, leads)
+    assert np.array_equal(data[0], val[6])
+    assert np.array_equal(data[1], val[1])
+    assert not data[2].any()
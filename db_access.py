@@ -20,7 +20,8 @@ import sys
 import traceback
 from pathlib import Path
 
-import pandas as pd
+from parameters import DefaultArguments
+from sql_functions import register_signal_functions
 
 
 class DbAccess(object):
@@ -36,6 +37,7 @@ class DbAccess(object):
         db = sqlite3.connect(str(data_dir / db_name))
         db.execute("PRAGMA journal_mode = OFF;")
         db.execute("PRAGMA page_size = 16384;")
+        register_signal_functions(db)
         return db
 
     def read(self, query: str):
@@ -45,6 +47,14 @@ class DbAccess(object):
         cur.close()
         return data
 
+    def has_table(self, table_name: str):
+        return len(self.read(f"SELECT name FROM sqlite_master WHERE type = 'table' AND name = '{table_name}'")) > 0
+
+    def read_df(self, query: str):
+        """ Same as read, returning a pandas DataFrame. pandas is imported on first use only. """
+        import pandas as pd
+        return pd.read_sql_query(query, self.db)
+
     def write(self, query: str):
         query = self._append_semicolumn(query)
         cur = self.db.cursor()
@@ -77,10 +87,12 @@ class DbAccess(object):
         cur.close()
 
     def _check_structure(self):
+        import pandas as pd
         tables = pd.read_sql_query('SELECT * FROM sqlite_master ;', self.db)
         print(tables)
 
     def _check_table(self, table_name: str):
+        import pandas as pd
         table = pd.read_sql_query(f'SELECT * FROM {table_name};', self.db)
         print(table)
 
@@ -89,3 +101,19 @@ class DbAccess(object):
         if query[-1] != ';':
             query += ';'
         return query
+
+
+def shard_file_name(db_file_name: str, dataset_name: str):
+    """
+    File name of the shard holding a single dataset, e.g. af.db -> af_WFDB_PTBXL.db
+    :param db_file_name: database file name of the whole shard set
+    :param dataset_name: Dataset name
+    :return: shard file name
+    """
+    db_file_name = Path(db_file_name)
+    return f'{db_file_name.stem}_{dataset_name}{db_file_name.suffix}'
+
+
+def shard_id_offset(dataset_name: str):
+    """ First patient id of a dataset shard minus one, so that patient ids are unique across the shard set. """
+    return DefaultArguments.all_ds.index(dataset_name) * DefaultArguments.shard_id_stride
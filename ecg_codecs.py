@@ -0,0 +1,205 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Lossless codecs for int16 ecg recordings.
+Every codec encodes a (num_leads, num_samples) int16 array into a single blob and decodes it back bit-exactly.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec(object):
+    codec_id = None
+    name = None
+
+    @property
+    def available(self):
+        return True
+
+    def encode(self, signal: np.ndarray) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, blob: bytes, num_leads: int, num_samples: int) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RawCodec(Codec):
+    """ Little endian int16 samples, lead after lead. """
+    codec_id = 0
+    name = 'raw'
+
+    def encode(self, signal):
+        return as_int16(signal).tobytes()
+
+    def decode(self, blob, num_leads, num_samples):
+        # copy: a view on the SQLite blob would be read-only
+        return np.frombuffer(blob, dtype='<i2').reshape(num_leads, num_samples).copy()
+
+
+class DeltaZlibCodec(Codec):
+    """ First order difference along time (wrapping int16 arithmetic) compressed with zlib. """
+    codec_id = 1
+    name = 'delta_zlib'
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def encode(self, signal):
+        return zlib.compress(_delta(as_int16(signal)).tobytes(), self.level)
+
+    def decode(self, blob, num_leads, num_samples):
+        delta = np.frombuffer(zlib.decompress(blob), dtype='<i2').reshape(num_leads, num_samples)
+        return _undelta(delta)
+
+
+class DeltaZstdCodec(Codec):
+    """ First order difference along time compressed with zstd. Requires the optional zstandard package. """
+    codec_id = 2
+    name = 'delta_zstd'
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    @property
+    def available(self):
+        return zstandard is not None
+
+    def encode(self, signal):
+        self._check_available()
+        return zstandard.ZstdCompressor(level=self.level).compress(_delta(as_int16(signal)).tobytes())
+
+    def decode(self, blob, num_leads, num_samples):
+        self._check_available()
+        delta = np.frombuffer(zstandard.ZstdDecompressor().decompress(blob), dtype='<i2')
+        return _undelta(delta.reshape(num_leads, num_samples))
+
+    def _check_available(self):
+        if not self.available:
+            raise ImportError(f'codec {self.name} requires the zstandard package')
+
+
+class LpcRiceCodec(Codec):
+    """
+    Second order fixed linear prediction followed by Rice coding of the residuals, one Rice parameter per lead.
+    Blob layout: k per lead (uint8), size of the unary stream (uint32), unary quotients, packed remainders.
+    """
+    codec_id = 3
+    name = 'lpc_rice'
+
+    def encode(self, signal):
+        signal = as_int16(signal)
+        num_leads = signal.shape[0]
+
+        # e[n] = x[n] - 2x[n-1] + x[n-2], with x[-1] = x[-2] = 0
+        folded = _zigzag(_second_difference(signal))
+
+        means = folded.mean(axis=1) if folded.size else np.zeros(num_leads)
+        ks = np.clip(np.floor(np.log2(np.maximum(means, 1.0))), 0, 30).astype(np.uint8)
+
+        quotients = (folded >> ks[:, None].astype(np.int64)).ravel()
+
+        # unary code: q ones followed by a zero
+        unary = np.ones(int(quotients.sum()) + len(quotients), dtype=np.uint8)
+        unary[np.cumsum(quotients + 1) - 1] = 0
+        unary = np.packbits(unary)
+
+        remainders = [_to_bits(folded[i] & ((1 << int(ks[i])) - 1), int(ks[i])) for i in range(num_leads)]
+        remainders = np.packbits(np.concatenate(remainders)) if remainders else np.zeros(0, dtype=np.uint8)
+
+        header = ks.tobytes() + struct.pack('<I', len(unary))
+        return header + unary.tobytes() + remainders.tobytes()
+
+    def decode(self, blob, num_leads, num_samples):
+        ks = np.frombuffer(blob, dtype=np.uint8, count=num_leads)
+        unary_size, = struct.unpack_from('<I', blob, num_leads)
+        offset = num_leads + 4
+
+        unary = np.unpackbits(np.frombuffer(blob, dtype=np.uint8, count=unary_size, offset=offset))
+        terminators = np.flatnonzero(unary == 0)[:num_leads * num_samples]
+        quotients = np.diff(terminators, prepend=-1) - 1
+
+        remainder_bits = np.unpackbits(np.frombuffer(blob, dtype=np.uint8, offset=offset + unary_size))
+        folded = np.empty((num_leads, num_samples), dtype=np.int64)
+        bit_offset = 0
+        for i, k in enumerate(ks.astype(int)):
+            bits = remainder_bits[bit_offset:bit_offset + k * num_samples].reshape(num_samples, k)
+            remainders = bits.astype(np.int64) @ (1 << np.arange(k - 1, -1, -1, dtype=np.int64))
+            folded[i] = (quotients[i * num_samples:(i + 1) * num_samples] << k) | remainders
+            bit_offset += k * num_samples
+
+        residuals = (folded >> 1) ^ -(folded & 1)  # undo zigzag
+        return np.cumsum(np.cumsum(residuals, axis=1), axis=1).astype(np.int16)
+
+
+codecs = {c.codec_id: c for c in (RawCodec(), DeltaZlibCodec(), DeltaZstdCodec(), LpcRiceCodec())}
+codecs_by_name = {c.name: c for c in codecs.values()}
+
+
+def get_codec(codec):
+    """
+    Resolve a codec from its id or name.
+    :param codec: codec id (as stored per recording) or codec name
+    :return: Codec instance
+    """
+    try:
+        return codecs[codec] if isinstance(codec, (int, np.integer)) else codecs_by_name[codec]
+    except KeyError:
+        raise ValueError(f'unknown ecg codec: {codec}')
+
+
+def as_int16(signal):
+    """ Cast a recording to a C-contiguous little endian int16 array, refusing lossy casts. """
+    signal = np.asarray(signal)
+    if signal.dtype != np.int16:
+        if signal.size and (signal.min() < np.iinfo(np.int16).min or signal.max() > np.iinfo(np.int16).max):
+            raise ValueError('ecg samples do not fit into int16')
+        if not np.array_equal(signal, np.round(signal)):
+            raise ValueError('ecg samples are not integer valued')
+    return np.ascontiguousarray(signal, dtype='<i2')
+
+
+def _delta(signal):
+    return np.diff(signal, axis=1, prepend=np.zeros((signal.shape[0], 1), dtype=signal.dtype))
+
+
+def _undelta(delta):
+    return np.cumsum(delta, axis=1, dtype=np.int16)
+
+
+def _second_difference(signal):
+    signal = signal.astype(np.int32)
+    first = np.diff(signal, axis=1, prepend=np.zeros((signal.shape[0], 1), dtype=np.int32))
+    return np.diff(first, axis=1, prepend=np.zeros((signal.shape[0], 1), dtype=np.int32))
+
+
+def _zigzag(residuals):
+    residuals = residuals.astype(np.int64)
+    return np.where(residuals >= 0, residuals << 1, ((-residuals) << 1) - 1)
+
+
+def _to_bits(values, k):
+    if k == 0:
+        return np.zeros(0, dtype=np.uint8)
+    shifts = np.arange(k - 1, -1, -1, dtype=np.int64)
+    return ((values[:, None] >> shifts) & 1).astype(np.uint8).ravel()
@@ -13,10 +13,15 @@
 #  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 #  DEALINGS IN THE SOFTWARE.
 
+from catalog import PatientCatalog, sql_value
+from concurrent.futures import ThreadPoolExecutor
 from db_access import DbAccess
+from ecg_codecs import get_codec
+from running_stats import merge_moments, scale_moments, std
 from pathlib import Path
+import time
 
-import pandas as pd
+import numpy as np
 
 datasets_path = Path('./data_access/datasets')
 
@@ -26,10 +31,67 @@ class LoadDb(DbAccess):
     TABLE_DX_DICT = 'diagnosis_dictionary'
     TABLE_DIAGNOSES = 'diagnoses'
     TABLE_DS_DICT = 'dataset_dictionary'
+    TABLE_ECG = 'ecg_signals'
+    TABLE_R_PEAKS = 'r_peaks'
+    TABLE_NORM_STATS = 'norm_stats'
     SAMPLING_FREQUENCY = 250
 
-    def __init__(self, data_dir: str, db_file_name: str):
-        super(LoadDb, self).__init__(data_dir, db_file_name)
+    def __init__(self, data_dir: str, db_file_name, catalog: bool = False, catalog_refresh: float = 1.0):
+        """
+
+        :param data_dir: Path to the .db file(s)
+        :param db_file_name: database file name, or list of shard file names (see create_db.create_shards) that are
+        attached and queried as a single database
+        :param catalog: load patients and diagnoses in memory once (see catalog.PatientCatalog) and answer the
+        metadata lookups from it instead of querying the database
+        :param catalog_refresh: minimum number of seconds between two checks for changes made to the database by other
+        connections, see refresh_catalog. Changes made through this connection are seen on the next lookup
+        """
+        shards = [db_file_name] if isinstance(db_file_name, str) else list(db_file_name)
+        super(LoadDb, self).__init__(data_dir, shards[0])
+        if len(shards) > 1:
+            self._attach_shards(data_dir, shards[1:])
+        # databases created before the codec layer store one table per patient, see _get_legacy_ecg
+        self.has_ecg_table = self.has_table(self.TABLE_ECG)
+        self._norm_stats = {}
+        self._catalog = PatientCatalog(self) if catalog else None
+        self.catalog_refresh = catalog_refresh
+        self._catalog_checked = time.monotonic()
+
+    def _attach_shards(self, data_dir, shards: list):
+        """
+        Attach the remaining shards and shadow the per patient tables with temporary UNION ALL views, which take
+        precedence over the tables of the main shard. Dictionary tables are identical in every shard.
+        :param data_dir: Path to the .db files
+        :param shards: shard file names other than the main one
+        :return:
+        """
+        schemas = ['main']
+        for i, shard in enumerate(shards):
+            self.db.execute(f"ATTACH DATABASE ? AS shard{i}", (str(data_dir / shard),))
+            schemas.append(f'shard{i}')
+
+        for table in filter(self.has_table, (self.TABLE_PATIENTS, self.TABLE_DIAGNOSES, self.TABLE_ECG,
+                                             self.TABLE_R_PEAKS, self.TABLE_NORM_STATS)):
+            union = ' UNION ALL '.join([f'SELECT * FROM {s}.{table}' for s in schemas])
+            self.write(f"CREATE TEMP VIEW {table} AS {union}")
+
+    @property
+    def catalog(self):
+        """ In-memory patient catalog, None if disabled. The staleness check is throttled, see catalog_refresh. """
+        if self._catalog is not None and (self._catalog.changed_here() or
+                                          time.monotonic() - self._catalog_checked >= self.catalog_refresh):
+            self.refresh_catalog()
+        return self._catalog
+
+    def refresh_catalog(self):
+        """
+        Reload the catalog now if the database changed since it was loaded, e.g. after another process wrote to it.
+        :return:
+        """
+        if self._catalog is not None and self._catalog.is_stale():
+            self._catalog = PatientCatalog(self)
+        self._catalog_checked = time.monotonic()
 
     def get_patients_with_diagnoses(self, to_df: bool = False, n: int = None):
         """
@@ -38,6 +100,12 @@ class LoadDb(DbAccess):
         :param n: number of patients
         :return: with to_df = True return dataframe with patient id and diagnosis code
         """
+        catalog = self.catalog
+        if catalog is not None and not to_df:
+            rows = np.flatnonzero(np.diff(catalog.dx_indptr) > 0)
+            rows = np.random.permutation(rows)[:n]
+            return [(int(catalog.patient_ids[r]), ','.join(catalog.diagnoses(r))) for r in rows]
+
         query = f"SELECT p.patient_id, GROUP_CONCAT(d.dx_code, ',') as 'diagnoses' FROM {self.TABLE_PATIENTS} as p " \
                 f"INNER JOIN {self.TABLE_DIAGNOSES} as pd ON p.patient_id = pd.patient_id " \
                 f"INNER JOIN {self.TABLE_DX_DICT} as d ON pd.diagnosis_id = d.diagnosis_id " \
@@ -46,7 +114,7 @@ class LoadDb(DbAccess):
 
         if n is not None:
             query += f"LIMIT {n}"
-        data = pd.read_sql_query(query, self.db) if to_df else self.read(query)
+        data = self.read_df(query) if to_df else self.read(query)
         return data
 
     def get_single_patient_data(self, patient_id: int, to_df: bool = False):
@@ -54,15 +122,23 @@ class LoadDb(DbAccess):
         Get original id and diagnosis code for a single patient.
         :param patient_id: Patient id to retrieve data from
         :param to_df: cast output to a Dataframe
-        :return: with to_df = True, return a dataframe with original_id and corresponding diagnosis
+        :return: with to_df = True, return a dataframe with original_id and corresponding diagnosis. The diagnosis is
+        None for a patient without diagnoses, KeyError is raised for an unknown patient id
         """
+        catalog = self.catalog
+        if catalog is not None and not to_df:
+            row = catalog.rows(patient_id)[0]
+            return str(catalog.patients['original_id'][row]), ','.join(catalog.diagnoses(row)) or None
+
         query = f"SELECT p.original_id, GROUP_CONCAT(d.dx_code, ',') as 'diagnosis' FROM {self.TABLE_PATIENTS} as p " \
-                f"INNER JOIN {self.TABLE_DIAGNOSES} as pd ON p.patient_id = pd.patient_id " \
-                f"INNER JOIN {self.TABLE_DX_DICT} as d ON pd.diagnosis_id = d.diagnosis_id " \
+                f"LEFT JOIN {self.TABLE_DIAGNOSES} as pd ON p.patient_id = pd.patient_id " \
+                f"LEFT JOIN {self.TABLE_DX_DICT} as d ON pd.diagnosis_id = d.diagnosis_id " \
                 f"WHERE p.patient_id = {patient_id} " \
                 f"GROUP BY p.patient_id " \
 
-        data = pd.read_sql_query(query, self.db) if to_df else self.read(query)
+        data = self.read_df(query) if to_df else self.read(query)
+        if not to_df and not data:
+            raise KeyError(f'patient id not found: {patient_id}')
         return data[0]
 
     def get_covariates(self, patient_ids: tuple, to_df: bool = False):
@@ -72,25 +148,253 @@ class LoadDb(DbAccess):
         :param to_df: cast the output to a DataFrame
         :return: with to_df = True, return a dataframe with age and sex of the corresponding patient(s)
         """
+        catalog = self.catalog
+        if catalog is not None and not to_df:
+            patients = catalog.patients[catalog.rows(np.unique(patient_ids), skip_missing=True)]
+            return [(sql_value(age), sql_value(sex)) for age, sex in zip(patients['age'], patients['sex'])]
+
         if len(patient_ids) > 1:
             query = f"SELECT age, sex FROM {self.TABLE_PATIENTS} WHERE patient_id IN {patient_ids}"
         else:
             query = f"SELECT age, sex FROM {self.TABLE_PATIENTS} WHERE patient_id = {patient_ids[0]}"
-        data = pd.read_sql_query(query, self.db) if to_df else self.read(query)
+        data = self.read_df(query) if to_df else self.read(query)
         return data
 
         """ Get ecg lead time series. """
 
-    def get_ecg(self, patient_id: int, leads: list = None, window_length: float = None):
+    def get_ecg(self, patient_id: int, leads: list = None, window_length: float = None, normalize: bool = False,
+                physical_units: bool = False):
         """
         Get ecg lead time series.
         :param patient_id: Patient id to retrieve ecg time series from
         :param leads: List of lead numbers to retrieve. If None retrieve all the leads
         :param window_length: Time series window length in seconds. If None retrieve the whole time series for each lead
-        :return: (m, n) numpy array, with m = number of ecg leads and n = time series duration of the retrieved ecg.
+        :param normalize: standardize each lead with the statistics of the patient's dataset, or of its calibration
+        group in ADC units, see get_norm_stats
+        :param physical_units: convert ADC units to mV with the patient's baselines and ADC gains
+        :return: (n, m) numpy array, with n = time series duration of the retrieved ecg and m = number of ecg leads.
+        """
+
+        if not self.has_ecg_table:
+            data = self._get_legacy_ecg(patient_id, leads, window_length).T
+        else:
+            codec_id, num_leads, num_samples, blob = self.read(f"SELECT codec_id, num_leads, num_samples, data "
+                                                               f"FROM {self.TABLE_ECG} "
+                                                               f"WHERE patient_id = {patient_id}")[0]
+            data = get_codec(codec_id).decode(blob, num_leads, num_samples)
+
+            if leads is not None:
+                data = data[[l - 1 for l in leads]]
+            if window_length is not None:
+                data = data[:, :int(window_length * self.SAMPLING_FREQUENCY)]
+
+        if normalize or physical_units:
+            data = self._calibrate(patient_id, data, leads, normalize, physical_units)
+
+        return data.T
+
+    def _calibrate(self, patient_id: int, data, leads: list = None, normalize: bool = False,
+                   physical_units: bool = False):
+        """
+        Apply ADC calibration and/or normalization to a (m, n) ecg array.
+        :return: (m, n) float numpy array
+        """
+        lead_idx = list(range(12)) if leads is None else [l - 1 for l in leads]
+        catalog = self.catalog
+        if catalog is not None:
+            patient = catalog.patients[catalog.rows(patient_id)[0]]
+            dataset_id, baselines, adc_gains = patient['dataset_id'], patient['baselines'], patient['adc_gains']
+        else:
+            columns = [f'bs{l}' for l in range(1, 13)] + [f'ad{l}' for l in range(1, 13)]
+            row = self.read(f"SELECT dataset_id, {', '.join(columns)} FROM {self.TABLE_PATIENTS} "
+                            f"WHERE patient_id = {patient_id}")[0]
+            dataset_id, baselines, adc_gains = row[0], np.array(row[1:13], dtype=np.float64), row[13:25]
+
+        data = data.astype(np.float64)
+        if physical_units:
+            data = (data - baselines[lead_idx, None]) / _safe_gains(adc_gains)[lead_idx, None]
+        if normalize:
+            if physical_units:
+                mean, sd = self.get_norm_stats(physical_units=True)[dataset_id]
+                mean, sd = mean[lead_idx], sd[lead_idx]
+            else:
+                groups = self.get_norm_stats(physical_units=False)
+                mean, sd = np.array([groups[(dataset_id, l + 1, baselines[l], adc_gains[l])] for l in lead_idx]).T
+            data = (data - mean[:, None]) / np.where(sd == 0, 1, sd)[:, None]
+        return data
+
+    def get_norm_stats(self, physical_units: bool = False):
+        """
+        Get per lead mean and standard deviation from the moments accumulated at ingest. ADC units are only
+        comparable within a calibration group (baseline, ADC gain), whose statistics are kept apart; in mV the groups
+        of a dataset are merged. Computed once per physical_units value.
+        :param physical_units: statistics of the signals converted to mV instead of ADC units
+        :return: with physical_units = True, dict of dataset id -> ((12,) mean, (12,) standard deviation) numpy
+        arrays, otherwise dict of (dataset id, lead, baseline, ADC gain) -> (mean, standard deviation)
+        """
+        if physical_units in self._norm_stats:
+            return self._norm_stats[physical_units]
+
+        rows = self.read(f"SELECT dataset_id, lead, baseline, adc_gain, count, mean, m2 FROM {self.TABLE_NORM_STATS}")
+        if not physical_units:
+            result = {(ds_id, lead, baseline, adc_gain): (mean, float(std((count, mean, m2))))
+                      for ds_id, lead, baseline, adc_gain, count, mean, m2 in rows}
+            self._norm_stats[physical_units] = result
+            return result
+
+        stats = {}
+        for ds_id, lead, baseline, adc_gain, count, mean, m2 in rows:
+            lead_stats = scale_moments((count, mean, m2), baseline, _safe_gains(adc_gain))
+            key = (ds_id, lead)
+            stats[key] = merge_moments(stats[key], lead_stats) if key in stats else lead_stats
+
+        result = {}
+        for (ds_id, lead), lead_stats in stats.items():
+            mean, sd = result.setdefault(ds_id, (np.zeros(12), np.zeros(12)))
+            mean[lead - 1], sd[lead - 1] = lead_stats[1], std(lead_stats)
+        self._norm_stats[physical_units] = result
+        return result
+
+    def _read_ecgs(self, patient_ids: list, leads: list = None):
+        """
+        Decode the ecg time series of several patients with a single query.
+        :param patient_ids: list of patient ids
+        :param leads: List of lead numbers to retrieve. If None retrieve all the leads
+        :return: generator of (patient_id, (m, n) numpy array), with m = number of ecg leads and n = number of samples
+        """
+        if not self.has_ecg_table:
+            for patient_id in patient_ids:
+                yield patient_id, self._get_legacy_ecg(patient_id, leads).T
+            return
+
+        cur = self.db.cursor()
+        cur.execute(f"SELECT patient_id, codec_id, num_leads, num_samples, data FROM {self.TABLE_ECG} "
+                    f"WHERE patient_id IN ({', '.join(map(str, patient_ids))})")
+        for patient_id, codec_id, num_leads, num_samples, blob in cur:
+            data = get_codec(codec_id).decode(blob, num_leads, num_samples)
+            yield patient_id, data if leads is None else data[[l - 1 for l in leads]]
+        cur.close()
+
+    def get_r_peaks(self, patient_ids: tuple):
+        """
+        Get the R peak sample positions detected during ingest.
+        :param patient_ids: list of patient ids
+        :return: dict of patient id -> (num_beats,) numpy array of sample positions
+        """
+        rows = self.read(f"SELECT patient_id, positions FROM {self.TABLE_R_PEAKS} "
+                         f"WHERE patient_id IN ({', '.join(map(str, patient_ids))})")
+        return {patient_id: np.frombuffer(positions, dtype='<u4').astype(np.int64) for patient_id, positions in rows}
+
+    def get_rr_intervals(self, patient_ids: tuple):
+        """
+        Get RR intervals from the R peaks detected during ingest.
+        :param patient_ids: list of patient ids
+        :return: dict of patient id -> (num_beats - 1,) numpy array of RR intervals in seconds
+        """
+        return {patient_id: np.diff(peaks) / self.SAMPLING_FREQUENCY
+                for patient_id, peaks in self.get_r_peaks(patient_ids).items()}
+
+    def get_beats(self, patient_id: int, lead: int = 2, pre: float = 0.25, post: float = 0.45):
+        """
+        Get beat aligned segments of one lead. Beats whose segment exceeds the recording are dropped.
+        :param patient_id: Patient id to retrieve beats from
+        :param lead: lead number
+        :param pre: segment length before the R peak in seconds
+        :param post: segment length after the R peak in seconds
+        :return: ((num_beats, pre + post samples) numpy array of segments, (num_beats,) R peak sample positions)
+        """
+        peaks = self.get_r_peaks((patient_id,)).get(patient_id, np.zeros(0, dtype=np.int64))
+        ecg = self.get_ecg(patient_id, leads=[lead])[:, 0]
+        pre, post = int(pre * self.SAMPLING_FREQUENCY), int(post * self.SAMPLING_FREQUENCY)
+
+        peaks = peaks[(peaks >= pre) & (peaks + post <= len(ecg))]
+        return ecg[peaks[:, None] + np.arange(-pre, post)], peaks
+
+    def get_ecg_batch(self, patient_ids: list, leads: list = None):
+        """
+        Get the ecg time series of several patients, zero padded to the longest one.
+        :param patient_ids: list of patient ids
+        :param leads: List of lead numbers to retrieve. If None retrieve all the leads
+        :return: ((batch, m, n) int16 numpy array in patient_ids order, (batch,) numpy array of unpadded lengths)
+        """
+        ecgs = dict(self._read_ecgs(patient_ids, leads))
+        ecgs = [ecgs[p] for p in patient_ids]
+        lengths = np.array([e.shape[1] for e in ecgs], dtype=np.int64)
+        num_leads = 12 if leads is None else len(leads)
+        batch = np.zeros((len(ecgs), num_leads, lengths.max() if len(ecgs) else 0), dtype=np.int16)
+        for i, ecg in enumerate(ecgs):
+            batch[i, :, :ecg.shape[1]] = ecg
+        return batch, lengths
+
+    def iter_ecgs(self, cohort_or_query, batch_size: int = 64, leads: list = None, window: float = None):
         """
+        Stream the ecg time series of a cohort in batches. Rows are pulled from a single SQLite cursor batch_size at a
+        time and the next batch is decoded in a background thread while the current one is consumed, so memory is
+        bounded by about two batches whatever the cohort size.
+        :param cohort_or_query: list of patient ids, or query whose first column is the patient id
+        :param batch_size: number of recordings per batch
+        :param leads: List of lead numbers to retrieve. If None retrieve all the leads
+        :param window: Time series window length in seconds. If None retrieve the whole time series for each lead
+        :return: generator of (metadata, signal_batch) tuples. metadata is a list of (patient_id, original_id,
+        dataset_id, age, sex, num_samples) tuples. With window = None signal_batch is a list of (m, n) numpy arrays,
+        otherwise a (batch, m, window samples) numpy array, zero padded for recordings shorter than the window.
+        """
+        cohort = cohort_or_query if isinstance(cohort_or_query, str) else ', '.join(map(str, cohort_or_query))
+        window_samples = None if window is None else int(window * self.SAMPLING_FREQUENCY)
+        metadata_columns = 'p.patient_id, p.original_id, p.dataset_id, p.age, p.sex, p.num_samples'
+
+        def decode(rows):
+            metadata = [r[:6] for r in rows]
+            if self.has_ecg_table:
+                signals = [get_codec(codec_id).decode(blob, num_leads, num_samples)[:, :window_samples]
+                           for codec_id, num_leads, num_samples, blob in (r[6:] for r in rows)]
+                if leads is not None:
+                    signals = [s[[l - 1 for l in leads]] for s in signals]
+            else:
+                signals = [r[6] for r in rows]
+            if window_samples is not None:
+                batch = np.zeros((len(signals), len(signals[0]), window_samples), dtype=np.int16)
+                for i, s in enumerate(signals):
+                    batch[i, :, :s.shape[1]] = s
+                signals = batch
+            return metadata, signals
+
+        cur = self.db.cursor()
+        if self.has_ecg_table:
+            cur.execute(f"SELECT {metadata_columns}, e.codec_id, e.num_leads, e.num_samples, e.data "
+                        f"FROM {self.TABLE_PATIENTS} as p "
+                        f"INNER JOIN {self.TABLE_ECG} as e ON p.patient_id = e.patient_id "
+                        f"WHERE p.patient_id IN ({cohort})")
+        else:
+            cur.execute(f"SELECT {metadata_columns} FROM {self.TABLE_PATIENTS} as p WHERE p.patient_id IN ({cohort})")
 
-        original_id = self.read(f"SELECT original_id FROM {self.TABLE_PATIENTS} WHERE patient_id = {patient_id}")
+        executor = ThreadPoolExecutor(max_workers=1)
+        pending = None
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if not self.has_ecg_table:
+                    # legacy tables are read through the connection, which cannot be shared with the worker thread
+                    rows = [r + (self._get_legacy_ecg(r[0], leads, window).T,) for r in rows]
+                future = executor.submit(decode, rows)
+                if pending is not None:
+                    yield pending.result()
+                pending = future
+            if pending is not None:
+                yield pending.result()
+        finally:
+            cur.close()
+            executor.shutdown(wait=True)
+
+    def _get_legacy_ecg(self, patient_id: int, leads: list = None, window_length: float = None):
+        """ Get ecg lead time series from a row per sample data_<original_id> table. """
+        catalog = self.catalog
+        if catalog is not None:
+            original_id = [(catalog.patients['original_id'][catalog.rows(patient_id)[0]],)]
+        else:
+            original_id = self.read(f"SELECT original_id FROM {self.TABLE_PATIENTS} WHERE patient_id = {patient_id}")
         leads = tuple([f'lead{l}' for l in range(1, 13)]) if leads is None else tuple([f'lead{l}' for l in leads])
         query = f"SELECT {', '.join([str(i) for i in leads])} FROM data_{original_id[0][0]} "
 
@@ -101,7 +405,97 @@ class LoadDb(DbAccess):
         def to_int(b):
             return int.from_bytes(b, byteorder='little', signed=True)
 
-        data = pd.read_sql_query(query, self.db)
+        data = self.read_df(query)
         data = data.applymap(to_int).to_numpy()
 
         return data
+
+    def export_parquet(self, out_dir: Path, cohort_query: str = None, chunk_size: int = 1000, leads: list = None):
+        """
+        Stream a cohort to Parquet, partitioned by dataset: out_dir/{patients,diagnoses,signals}/dataset_id=<id>/.
+        Patients are processed chunk_size at a time and every chunk is written as one row group, so memory does not
+        grow with the cohort size. Signals are stored lead-major, one row per recording, in a fixed size list column
+        of num_leads variable length int16 lists. Requires pyarrow.
+        :param out_dir: output directory
+        :param cohort_query: query whose first column is the patient id. If None export all the patients
+        :param chunk_size: number of patients per record batch
+        :param leads: List of lead numbers to export. If None export all the leads
+        :return:
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        out_dir = Path(out_dir)
+        cohort_query = f"SELECT patient_id FROM {self.TABLE_PATIENTS}" if cohort_query is None else cohort_query
+        num_leads = 12 if leads is None else len(leads)
+        int_columns = ('patient_id', 'dataset_id', 'num_leads', 'num_samples')
+        writers = {}
+
+        def write_partitioned(table, batch, ds_ids):
+            for ds_id in np.unique(ds_ids):
+                part = batch.filter(pa.array(ds_ids == ds_id))
+                if (table, ds_id) not in writers:
+                    part_dir = out_dir / table / f'dataset_id={ds_id}'
+                    part_dir.mkdir(parents=True, exist_ok=True)
+                    writers[(table, ds_id)] = pq.ParquetWriter(str(part_dir / 'part-0.parquet'), part.schema)
+                writers[(table, ds_id)].write_batch(part)
+
+        cohort = self.db.cursor()
+        cohort.execute(cohort_query)
+        try:
+            while True:
+                patient_ids = [r[0] for r in cohort.fetchmany(chunk_size)]
+                if not patient_ids:
+                    break
+                id_list = ', '.join(map(str, patient_ids))
+
+                # patients
+                cur = self.db.execute(f"SELECT * FROM {self.TABLE_PATIENTS} WHERE patient_id IN ({id_list})")
+                names = [d[0] for d in cur.description]
+                columns = list(zip(*cur.fetchall()))
+                arrays = [pa.array(c, type=pa.string() if n == 'original_id' else
+                                   pa.int64() if n in int_columns else pa.float64()) for n, c in zip(names, columns)]
+                ds_column = names.index('dataset_id')
+                dataset_of = dict(zip(columns[names.index('patient_id')], columns[ds_column]))
+                # dataset_id is carried by the partition directory
+                patients = pa.RecordBatch.from_arrays(arrays[:ds_column] + arrays[ds_column + 1:],
+                                                      names=names[:ds_column] + names[ds_column + 1:])
+                write_partitioned('patients', patients, np.array(columns[ds_column]))
+
+                # diagnoses
+                rows = self.read(f"SELECT pd.patient_id, d.dx_code FROM {self.TABLE_DIAGNOSES} as pd "
+                                 f"INNER JOIN {self.TABLE_DX_DICT} as d ON pd.diagnosis_id = d.diagnosis_id "
+                                 f"WHERE pd.patient_id IN ({id_list})")
+                if rows:
+                    pids, codes = zip(*rows)
+                    diagnoses = pa.RecordBatch.from_arrays([pa.array(pids, type=pa.int64()),
+                                                            pa.array(codes, type=pa.string())],
+                                                           names=['patient_id', 'dx_code'])
+                    write_partitioned('diagnoses', diagnoses, np.array([dataset_of[p] for p in pids]))
+
+                # signals
+                pids, values, lengths = [], [], []
+                for patient_id, ecg in self._read_ecgs(patient_ids, leads):
+                    pids.append(patient_id)
+                    values.append(ecg.ravel())
+                    lengths.append(ecg.shape[1])
+                if pids:
+                    lengths = np.array(lengths, dtype=np.int32)
+                    offsets = np.concatenate([[0], np.cumsum(np.repeat(lengths, num_leads))]).astype(np.int64)
+                    lead_lists = pa.LargeListArray.from_arrays(pa.array(offsets),
+                                                          pa.array(np.concatenate(values).astype(np.int16)))
+                    signals = pa.RecordBatch.from_arrays([pa.array(pids, type=pa.int64()),
+                                                          pa.array(lengths),
+                                                          pa.FixedSizeListArray.from_arrays(lead_lists, num_leads)],
+                                                         names=['patient_id', 'num_samples', 'signal'])
+                    write_partitioned('signals', signals, np.array([dataset_of[p] for p in pids]))
+        finally:
+            cohort.close()
+            for writer in writers.values():
+                writer.close()
+
+
+def _safe_gains(adc_gains):
+    """ ADC gains are 0 for leads missing from a recording, whose samples are all 0: divide those by 1. """
+    adc_gains = np.asarray(adc_gains, dtype=np.float64)
+    return np.where(adc_gains == 0, 1.0, adc_gains)
@@ -27,4 +27,5 @@ class DefaultArguments(object):
                   '270492004', '284470004', '365413008', '39732003', '426177001', '426627000', '426783006', '427084000',
                   '427172004', '427393009', '445118002', '47665007', '59931005', '6374002', '698252002', '713426002',
                   '713427006', '733534002']
-    all_ds = ['WFDB_ChapmanShaoxing', 'WFDB_CPSC2018', 'WFDB_CPSC2018_2', 'WFDB_Ga', 'WFDB_PTB', 'WFDB_PTBXL', 'WFDB_Ningbo']
\ No newline at end of file
+    all_ds = ['WFDB_ChapmanShaoxing', 'WFDB_CPSC2018', 'WFDB_CPSC2018_2', 'WFDB_Ga', 'WFDB_PTB', 'WFDB_PTBXL', 'WFDB_Ningbo']
+    shard_id_stride = 10000000  # patient id range reserved to each dataset shard
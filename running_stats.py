@@ -0,0 +1,76 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Streaming, mergeable first and second moments: (count, mean, m2) with m2 the sum of squared deviations from the
+mean. Partial moments are combined with the pairwise update of Chan et al., which reduces to Welford's update
+for a single sample. All functions work element-wise on scalars or numpy arrays.
+"""
+
+import numpy as np
+
+
+def moments(x: np.ndarray, axis: int = -1):
+    """
+    Moments of a batch of samples.
+    :param x: samples
+    :param axis: axis to reduce
+    :return: (count, mean, m2)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    count = x.shape[axis]
+    if count == 0:
+        shape = np.delete(x.shape, axis % x.ndim)
+        return 0, np.zeros(shape), np.zeros(shape)
+    mean = x.mean(axis=axis)
+    m2 = ((x - np.expand_dims(mean, axis)) ** 2).sum(axis=axis)
+    return count, mean, m2
+
+
+def merge_moments(a: tuple, b: tuple):
+    """
+    Merge two partial moments.
+    :param a: (count, mean, m2)
+    :param b: (count, mean, m2)
+    :return: (count, mean, m2) of the union of both sample sets
+    """
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    count = count_a + count_b
+    if np.all(count == 0):
+        return a
+    safe_count = np.where(count == 0, 1, count)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / safe_count
+    m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / safe_count
+    return count, mean, m2
+
+
+def scale_moments(a: tuple, offset, scale):
+    """
+    Moments of (x - offset) / scale given the moments of x.
+    :param a: (count, mean, m2)
+    :param offset: value subtracted from the samples
+    :param scale: value the samples are divided by
+    :return: (count, mean, m2)
+    """
+    count, mean, m2 = a
+    return count, (mean - offset) / scale, m2 / scale ** 2
+
+
+def std(a: tuple):
+    """ Population standard deviation from moments. """
+    count, _, m2 = a
+    return np.sqrt(m2 / np.where(count == 0, 1, count))
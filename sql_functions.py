@@ -0,0 +1,89 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+"""
+Signal functions registered on every connection, computed in SQLite on the blobs of the ecg_signals table.
+A stored recording is described by the four columns codec_id, num_leads, num_samples, data, which come first in
+every function; lead is a lead number, NULL for all the leads. Values are in ADC units.
+
+    SELECT patient_id FROM ecg_signals
+    WHERE ecg_max(codec_id, num_leads, num_samples, data, 2) > 3000
+
+Scalar functions:
+    ecg_max(codec_id, num_leads, num_samples, data, lead): maximum absolute amplitude
+    ecg_rms(codec_id, num_leads, num_samples, data, lead, start, length): RMS over a window of samples
+    ecg_zero_frac(codec_id, num_leads, num_samples, data, lead): fraction of samples equal to 0
+Aggregate functions:
+    ecg_pooled_rms(codec_id, num_leads, num_samples, data, lead): RMS over all the samples of a group of recordings
+"""
+
+import sqlite3
+from functools import lru_cache
+
+import numpy as np
+
+from ecg_codecs import get_codec
+
+
+@lru_cache(maxsize=8)
+def _decode(codec_id, num_leads, num_samples, data):
+    # several functions evaluated on the same row decode the blob once
+    return get_codec(codec_id).decode(data, num_leads, num_samples)
+
+
+def _lead(codec_id, num_leads, num_samples, data, lead):
+    ecg = _decode(codec_id, num_leads, num_samples, data)
+    return ecg if lead is None else ecg[lead - 1]
+
+
+def ecg_max(codec_id, num_leads, num_samples, data, lead):
+    signal = _lead(codec_id, num_leads, num_samples, data, lead)
+    return int(np.abs(signal.astype(np.int32)).max()) if signal.size else None
+
+
+def ecg_rms(codec_id, num_leads, num_samples, data, lead, start, length):
+    signal = _lead(codec_id, num_leads, num_samples, data, lead)[..., start:start + length]
+    return float(np.sqrt(np.mean(signal.astype(np.float64) ** 2))) if signal.size else None
+
+
+def ecg_zero_frac(codec_id, num_leads, num_samples, data, lead):
+    signal = _lead(codec_id, num_leads, num_samples, data, lead)
+    return float(np.count_nonzero(signal == 0) / signal.size) if signal.size else None
+
+
+class EcgPooledRms(object):
+    def __init__(self):
+        self.sum_squares = 0.0
+        self.count = 0
+
+    def step(self, codec_id, num_leads, num_samples, data, lead):
+        signal = _lead(codec_id, num_leads, num_samples, data, lead).astype(np.float64)
+        self.sum_squares += float(np.dot(signal.ravel(), signal.ravel()))
+        self.count += signal.size
+
+    def finalize(self):
+        return float(np.sqrt(self.sum_squares / self.count)) if self.count else None
+
+
+def register_signal_functions(db: sqlite3.Connection):
+    """
+    Register the signal functions on a connection.
+    :param db: SQLite connection
+    :return:
+    """
+    db.create_function('ecg_max', 5, ecg_max, deterministic=True)
+    db.create_function('ecg_rms', 7, ecg_rms, deterministic=True)
+    db.create_function('ecg_zero_frac', 5, ecg_zero_frac, deterministic=True)
+    db.create_aggregate('ecg_pooled_rms', 5, EcgPooledRms)
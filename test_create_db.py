@@ -0,0 +1,48 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+from create_db import CreateDb, create_shards
+from load_db import LoadDb
+from parameters import DefaultArguments
+
+
+def test_rebuilt_shard_replaces_the_old_one(tmp_path, synthetic_dataset):
+    dataset_name, recordings = synthetic_dataset
+    query = "SELECT patient_id, original_id FROM patients ORDER BY patient_id"
+
+    shards = create_shards(tmp_path, 'af.db', datasets=[dataset_name], processes=1)
+    first = LoadDb(tmp_path, shards).read(query)
+    shards = create_shards(tmp_path, 'af.db', datasets=[dataset_name], processes=1)
+    loader = LoadDb(tmp_path, shards)
+
+    assert loader.read(query) == first
+    assert len(first) == len(recordings)
+    assert loader.read("SELECT COUNT(*) FROM ecg_signals")[0][0] == len(recordings)
+    assert list(tmp_path.glob('*.partial')) == []
+
+
+def test_reingest_replaces_norm_stats(synthetic_db):
+    data_dir, db_file_name, recordings = synthetic_db
+    builder = CreateDb(data_dir, db_file_name)
+    query = "SELECT dataset_id, lead, baseline, adc_gain, count, mean, m2 FROM norm_stats ORDER BY 1, 2, 3, 4"
+    first = builder.read(query)
+
+    builder.write("DELETE FROM ecg_signals")
+    builder.write("DELETE FROM r_peaks")
+    builder.populate_data_tables(dataset_name=DefaultArguments.CPSC2018, ds_portion=1)
+
+    assert builder.read(query) == first
+    total = sum(r.shape[1] for r in recordings.values())
+    assert builder.read("SELECT SUM(count) FROM norm_stats WHERE lead = 1")[0][0] == total
@@ -0,0 +1,59 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pytest
+
+from ecg_codecs import codecs, get_codec, as_int16
+
+
+def _signals():
+    rng = np.random.default_rng(0)
+    t = np.arange(2500)
+    ecg = (rng.normal(0, 20, (12, 2500)) + 800 * np.exp(-((t / 250 * 1.2) % 1 - 0.5) ** 2 / 0.0004)).astype(np.int16)
+
+    extremes = np.zeros((12, 100), dtype=np.int16)
+    extremes[:, ::2] = np.iinfo(np.int16).max
+    extremes[:, 1::2] = np.iinfo(np.int16).min
+
+    spike = np.zeros((12, 500), dtype=np.int16)
+    spike[3, 250] = np.iinfo(np.int16).max
+
+    return {'ecg': ecg, 'extremes': extremes, 'spike': spike, 'flat': np.zeros((12, 300), dtype=np.int16),
+            'empty': np.zeros((12, 0), dtype=np.int16), 'single': np.array([[-7]] * 12, dtype=np.int16)}
+
+
+@pytest.mark.parametrize('codec', [c for c in codecs.values() if c.available], ids=lambda c: c.name)
+@pytest.mark.parametrize('name', list(_signals()))
+def test_round_trip(codec, name):
+    signal = _signals()[name]
+    decoded = codec.decode(codec.encode(signal), *signal.shape)
+    assert decoded.dtype == np.int16
+    assert np.array_equal(decoded, signal)
+    decoded[..., :1] = 1  # decoded arrays are writable
+
+
+def test_get_codec():
+    assert get_codec('raw') is get_codec(0)
+    with pytest.raises(ValueError):
+        get_codec('unknown')
+
+
+def test_as_int16_refuses_lossy_casts():
+    assert as_int16(np.array([[1.0, -2.0]])).dtype == np.int16
+    with pytest.raises(ValueError):
+        as_int16(np.array([[40000]]))
+    with pytest.raises(ValueError):
+        as_int16(np.array([[0.5]]))
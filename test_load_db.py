@@ -0,0 +1,122 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from load_db import LoadDb
+
+
+def _calibration(loader):
+    """ dict of original id -> (patient id, dataset id, (12,) baselines, (12,) ADC gains) """
+    rows = loader.read("SELECT original_id, patient_id, dataset_id, bs1, ad1 FROM patients")
+    return {r[0]: (r[1], r[2], np.full(12, r[3]), np.full(12, r[4])) for r in rows}
+
+
+@pytest.mark.parametrize('catalog', [False, True])
+def test_norm_stats_in_physical_units_match_converted_signals(synthetic_db, catalog):
+    data_dir, db_file_name, recordings = synthetic_db
+    loader = LoadDb(data_dir, db_file_name, catalog=catalog)
+    calibration = _calibration(loader)
+
+    mv = np.concatenate([(recordings[i] - bs[:, None]) / ad[:, None] for i, (_, _, bs, ad) in calibration.items()],
+                        axis=1)
+    (dataset_id, (mean, sd)), = loader.get_norm_stats(physical_units=True).items()
+    assert np.allclose(mean, mv.mean(axis=1))
+    assert np.allclose(sd, mv.std(axis=1))
+
+    patient_id, _, bs, ad = calibration['A2']
+    expected = ((recordings['A2'] - bs[:, None]) / ad[:, None] - mean[:, None]) / sd[:, None]
+    assert np.allclose(loader.get_ecg(patient_id, normalize=True, physical_units=True), expected.T)
+
+
+@pytest.mark.parametrize('catalog', [False, True])
+def test_adc_normalization_uses_the_calibration_group(synthetic_db, catalog):
+    data_dir, db_file_name, recordings = synthetic_db
+    loader = LoadDb(data_dir, db_file_name, catalog=catalog)
+    calibration = _calibration(loader)
+    groups = loader.get_norm_stats(physical_units=False)
+
+    for original_id, (patient_id, dataset_id, bs, ad) in calibration.items():
+        group = np.concatenate([recordings[i] for i, c in calibration.items() if c[3][0] == ad[0]], axis=1)
+        mean, sd = groups[(dataset_id, 1, bs[0], ad[0])]
+        assert np.isclose(mean, group[0].mean()) and np.isclose(sd, group[0].std())
+
+        expected = (recordings[original_id] - group.mean(axis=1)[:, None]) / group.std(axis=1)[:, None]
+        assert np.allclose(loader.get_ecg(patient_id, leads=[3, 1], normalize=True), expected[[2, 0]].T)
+
+
+@pytest.fixture
+def loaders(synthetic_db):
+    """ SQL and catalog backed loaders of the same database """
+    data_dir, db_file_name, _ = synthetic_db
+    return LoadDb(data_dir, db_file_name), LoadDb(data_dir, db_file_name, catalog=True)
+
+
+def _split(rows):
+    return sorted((patient_id, sorted(dx.split(','))) for patient_id, dx in rows)
+
+
+def test_catalog_matches_sql(loaders):
+    sql, catalog = loaders
+    patient_ids = [r[0] for r in sql.read("SELECT patient_id FROM patients ORDER BY patient_id")]
+    unknown = max(patient_ids) + 1
+
+    assert _split(catalog.get_patients_with_diagnoses()) == _split(sql.get_patients_with_diagnoses())
+    assert len(catalog.get_patients_with_diagnoses(n=2)) == len(sql.get_patients_with_diagnoses(n=2)) == 2
+
+    for patient_id in patient_ids:
+        assert catalog.get_single_patient_data(patient_id) == sql.get_single_patient_data(patient_id)
+        for normalize, physical_units in [(True, False), (False, True), (True, True)]:
+            assert np.array_equal(catalog.get_ecg(patient_id, normalize=normalize, physical_units=physical_units),
+                                  sql.get_ecg(patient_id, normalize=normalize, physical_units=physical_units))
+
+    for ids in [tuple(patient_ids), (patient_ids[3], patient_ids[0], patient_ids[3]), (patient_ids[1], unknown),
+                (patient_ids[2],), (unknown,)]:
+        assert catalog.get_covariates(ids) == sql.get_covariates(ids)
+
+
+def test_patient_without_diagnoses(loaders):
+    for loader in loaders:
+        patient_id = loader.read("SELECT patient_id FROM patients WHERE original_id = 'A3'")[0][0]
+        assert loader.get_single_patient_data(patient_id) == ('A3', None)
+        assert patient_id not in [r[0] for r in loader.get_patients_with_diagnoses()]
+
+
+def test_unknown_patient(loaders):
+    for loader in loaders:
+        unknown = loader.read("SELECT MAX(patient_id) FROM patients")[0][0] + 1
+        with pytest.raises(KeyError):
+            loader.get_single_patient_data(unknown)
+
+
+@pytest.mark.skipif(not hasattr(pd.DataFrame, 'applymap'), reason='legacy tables are read with DataFrame.applymap')
+def test_legacy_tables(synthetic_db):
+    data_dir, db_file_name, recordings = synthetic_db
+    loader = LoadDb(data_dir, db_file_name)
+    loader.write("DROP TABLE ecg_signals")
+    for original_id, recording in recordings.items():
+        columns = [f'lead{l}' for l in range(1, 13)]
+        loader.write(f"CREATE TABLE data_{original_id} ({', '.join(f'{c} BLOB' for c in columns)})")
+        loader.write_many(f"INSERT INTO data_{original_id} VALUES ({', '.join('?' * 12)})",
+                          [tuple(int(v).to_bytes(2, 'little', signed=True) for v in sample) for sample in recording.T])
+
+    sql, catalog = LoadDb(data_dir, db_file_name), LoadDb(data_dir, db_file_name, catalog=True)
+    for original_id, recording in recordings.items():
+        patient_id = sql.read(f"SELECT patient_id FROM patients WHERE original_id = '{original_id}'")[0][0]
+        ecg = sql.get_ecg(patient_id, leads=[2, 5], window_length=2)
+        assert np.array_equal(ecg, recording[[1, 4], :500].T)
+        assert np.array_equal(catalog.get_ecg(patient_id, leads=[2, 5], window_length=2), ecg)
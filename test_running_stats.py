@@ -0,0 +1,62 @@
+#  Copyright (c) 2021. Gaetano Scebba
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+#  documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+#  and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions
+#   of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+#  TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+#  CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pytest
+
+from running_stats import moments, merge_moments, scale_moments, std
+
+
+def _chunks():
+    rng = np.random.default_rng(0)
+    return [rng.normal(5, 3, (12, n)) for n in (1, 0, 250, 1000, 7)]
+
+
+def test_merged_moments_match_concatenated_samples():
+    chunks = _chunks()
+    merged = moments(chunks[0], axis=1)
+    for chunk in chunks[1:]:
+        merged = merge_moments(merged, moments(chunk, axis=1))
+    samples = np.concatenate(chunks, axis=1)
+    assert merged[0] == samples.shape[1]
+    assert np.allclose(merged[1], samples.mean(axis=1))
+    assert np.allclose(std(merged), samples.std(axis=1))
+
+
+def test_merge_is_order_independent():
+    a, b = (moments(chunk, axis=1) for chunk in _chunks()[2:4])
+    for x, y in zip(merge_moments(a, b), merge_moments(b, a)):
+        assert np.allclose(x, y)
+
+
+def test_empty_moments():
+    empty = moments(np.zeros((12, 0)), axis=1)
+    assert empty[0] == 0 and empty[1].shape == (12,)
+    assert np.array_equal(std(empty), np.zeros(12))
+
+    a = moments(_chunks()[2], axis=1)
+    for merged in (merge_moments(empty, a), merge_moments(a, empty)):
+        for x, y in zip(merged, a):
+            assert np.allclose(x, y)
+    for x, y in zip(merge_moments(empty, empty), empty):
+        assert np.array_equal(x, y)
+
+
+@pytest.mark.parametrize('offset, scale', [(0, 1), (10, 500), (-3.5, 0.25)])
+def test_scale_moments(offset, scale):
+    x = _chunks()[3]
+    scaled = scale_moments(moments(x, axis=1), offset, scale)
+    assert np.allclose(scaled[1], ((x - offset) / scale).mean(axis=1))
+    assert np.allclose(std(scaled), ((x - offset) / scale).std(axis=1))